@@ -1,51 +1,258 @@
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from logging import getLogger
+from typing import Optional
 from typing import Union
+from uuid import UUID
 
+from fastapi import BackgroundTasks
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt
 from jose import JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 import settings
-from db.dals import UserDAL
-from db.models import User
+from cache import principal_cache
+from db.dals import get_user_dal
+from db.dals import RevokedTokenDAL
+from db.models import mask_to_roles
+from db.models import PortalRole
+from db.records import AuthRecord
 from db.session import get_db
-from hashing import Hasher
+from hashing import async_hasher
+from revocation import revocation_list
+from security import create_access_token
+from security import decode_access_token
+
+logger = getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login/token")
 
 
-async def _get_user_by_email_for_auth(email: str, session: AsyncSession):
+class Principal:
+    """The authenticated user handed to handlers.
+
+    Slotted and immutable: it carries no password hash and no ORM state, and
+    a single instance can be shared by every request it is cached for.
+    """
+
+    __slots__ = (
+        "user_id",
+        "email",
+        "roles",
+        "role_mask",
+        "is_active",
+        "is_admin",
+        "is_superadmin",
+    )
+
+    user_id: UUID
+    email: str
+    roles: frozenset[PortalRole]
+    role_mask: int
+    is_active: bool
+    is_admin: bool
+    is_superadmin: bool
+
+    def __init__(self, user_id: UUID, email: str, role_mask: int, is_active: bool):
+        init = super().__setattr__
+        init("user_id", user_id)
+        init("email", email)
+        init("roles", mask_to_roles(role_mask))
+        init("role_mask", role_mask)
+        init("is_active", is_active)
+        init("is_admin", bool(role_mask & PortalRole.ROLE_PORTAL_ADMIN.bit))
+        init("is_superadmin", bool(role_mask & PortalRole.ROLE_PORTAL_SUPERADMIN.bit))
+
+    @classmethod
+    def from_record(cls, record: AuthRecord) -> "Principal":
+        return cls(record.user_id, record.email, record.role_mask, record.is_active)
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> "Principal":
+        """Build from the verified claims of a self-contained access token,
+        raises ``ValueError`` if they are malformed"""
+        try:
+            return cls(
+                UUID(claims["uid"]),
+                claims["sub"],
+                int(claims["roles"]),
+                bool(claims["act"]),
+            )
+        except (KeyError, TypeError, ValueError) as err:
+            raise ValueError(f"Malformed token claims: {err}") from err
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, Principal):
+            return NotImplemented
+        return (
+            self.user_id == other.user_id
+            and self.email == other.email
+            and self.role_mask == other.role_mask
+            and self.is_active == other.is_active
+        )
+
+    def __hash__(self):
+        return hash((self.user_id, self.role_mask, self.is_active))
+
+    def __repr__(self):
+        return (
+            f"Principal(user_id={self.user_id!r}, email={self.email!r}, "
+            f"roles={sorted(self.roles)!r}, is_active={self.is_active!r})"
+        )
+
+
+def issue_tokens(user: AuthRecord) -> dict:
+    """Tokens returned by login and refresh.
+
+    With ``SELF_CONTAINED_TOKENS`` the access token carries everything a
+    principal is built from and lives only a few minutes. The refresh token
+    carries the token version, so changing the user's email, roles or
+    active status invalidates it.
+    """
+    if not settings.SELF_CONTAINED_TOKENS:
+        access_token = create_access_token(
+            data={"sub": user.email},
+            expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        )
+        return {"access_token": access_token, "token_type": "bearer"}
+    access_token = create_access_token(
+        data={
+            "typ": "access",
+            "sub": user.email,
+            "uid": str(user.user_id),
+            "roles": user.role_mask,
+            "act": user.is_active,
+            "ver": user.token_version,
+        },
+        expires_delta=timedelta(minutes=settings.SELF_CONTAINED_TOKEN_EXPIRE_MINUTES),
+    )
+    refresh_token = create_access_token(
+        data={
+            "typ": "refresh",
+            "sub": user.email,
+            "uid": str(user.user_id),
+            "ver": user.token_version,
+        },
+        expires_delta=timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES),
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+    }
+
+
+async def _get_user_by_email_for_auth(
+    email: str, session: AsyncSession
+) -> Union[AuthRecord, None]:
     async with session.begin():
-        user_dal = UserDAL(session)
-        return await user_dal.get_user_by_email(
+        user_dal = get_user_dal(session)
+        return await user_dal.get_auth_record_by_email(
             email=email,
         )
 
 
+async def _update_password_hash(
+    user_id: UUID, hashed_password: str, session: AsyncSession
+):
+    try:
+        async with session.begin():
+            user_dal = get_user_dal(session)
+            await user_dal.update_user(user_id, hashed_password=hashed_password)
+    except Exception:
+        # the old hash still works, the next login tries again
+        logger.exception("Failed to store the rehashed password of %s", user_id)
+
+
 async def authenticate_user(
-    email: str, password: str, db: AsyncSession
-) -> Union[User, None]:
+    email: str,
+    password: str,
+    db: AsyncSession,
+    background_tasks: Optional[BackgroundTasks] = None,
+) -> Union[AuthRecord, None]:
     user = await _get_user_by_email_for_auth(email=email, session=db)
-    if user is None:
+    # deactivated users can't log in, there is no point in hashing for them
+    if user is None or not user.is_active:
+        return
+    verified, new_hash = await async_hasher.verify_and_update(
+        password, user.hashed_password
+    )
+    if not verified:
         return
-    if not Hasher.verify_password(password, user.hashed_password):
-        return user
+    if new_hash is not None and background_tasks is not None:
+        # the hash is below the configured cost, it is replaced after the
+        # response has been sent
+        background_tasks.add_task(_update_password_hash, user.user_id, new_hash, db)
+    return user
+
+
+async def refresh_tokens(refresh_token: str, db: AsyncSession) -> Union[dict, None]:
+    """New tokens for a valid refresh token, None if it is invalid, was
+    used already or the user changed since it was issued"""
+    try:
+        payload = decode_access_token(refresh_token)
+        if payload.get("typ") != "refresh":
+            return
+        user_id = UUID(payload["uid"])
+        token_version = payload["ver"]
+        jti, expires_at = _token_id(payload)
+    except (JWTError, KeyError, TypeError, ValueError):
+        return
+    if revocation_list.is_revoked(jti):
+        return
+    async with db.begin():
+        user_dal = get_user_dal(db)
+        user = await user_dal.get_auth_record_by_id(user_id)
+        if user is None or not user.is_active or user.token_version != token_version:
+            return
+        # refresh tokens are single use, a second worker racing on the same
+        # one loses on the primary key
+        if not await RevokedTokenDAL(db).revoke(UUID(jti), expires_at):
+            return
+    revocation_list.add(jti)
+    return issue_tokens(user)
+
+
+def _token_id(payload: dict) -> tuple[str, datetime]:
+    """Id and expiry of a decoded token, raises KeyError, TypeError or
+    ValueError if either is missing or malformed"""
+    jti = payload["jti"]
+    UUID(jti)
+    return jti, datetime.fromtimestamp(payload["exp"], timezone.utc)
+
+
+async def revoke_token(token: str, db: AsyncSession) -> bool:
+    """Revoke ``token`` until it expires, False if it is invalid or has no
+    id. Other workers stop accepting it after their next sync."""
+    try:
+        jti, expires_at = _token_id(decode_access_token(token))
+    except (JWTError, KeyError, TypeError, ValueError):
+        return False
+    async with db.begin():
+        await RevokedTokenDAL(db).revoke(UUID(jti), expires_at)
+    revocation_list.add(jti)
+    return True
 
 
 async def get_current_user_from_token(
     token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
-):
+) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
     )
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
+        payload = decode_access_token(token)
         email: str = payload.get("sub")
 
         if email is None:
@@ -53,6 +260,33 @@ async def get_current_user_from_token(
 
     except JWTError:
         raise credentials_exception
-    user = await _get_user_by_email_for_auth(email=email, db=db)
-    if user is None:
+    # tokens issued before ids were added can't be revoked, they just expire
+    jti = payload.get("jti")
+    if jti is not None and revocation_list.is_revoked(jti):
+        raise credentials_exception
+    token_type = payload.get("typ")
+    if token_type == "access":
+        # self-contained, trusted as is until it expires
+        try:
+            principal = Principal.from_claims(payload)
+        except ValueError:
+            raise credentials_exception
+        if not principal.is_active:
+            raise credentials_exception
+        return principal
+    if token_type is not None:
+        raise credentials_exception
+    # emails match case-insensitively, so do the cache keys
+    cache_key = email.lower()
+    principal = principal_cache.get(cache_key)
+    if principal is None:
+        # looked up on the primary, a lagging replica could cache a row the
+        # last invalidation was meant to drop
+        user = await _get_user_by_email_for_auth(email=email, session=db)
+        if user is None:
+            raise credentials_exception
+        principal = Principal.from_record(user)
+        principal_cache.set(cache_key, principal)
+    if not principal.is_active:
         raise credentials_exception
+    return principal
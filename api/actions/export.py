@@ -0,0 +1,83 @@
+import csv
+import io
+import zlib
+from typing import AsyncIterator
+
+import orjson
+
+import settings
+from db.dals import get_user_dal
+from db.models import PortalRole
+
+EXPORT_COLUMNS = ["user_id", "name", "surname", "email", "is_active", "roles"]
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _role_names(role_mask: int) -> list[str]:
+    return [role.value for role in PortalRole if role_mask & role.bit]
+
+
+def _encode_ndjson(rows) -> bytes:
+    lines = []
+    for row in rows:
+        record = dict(zip(EXPORT_COLUMNS, row))
+        record["user_id"] = str(record["user_id"])
+        record["roles"] = _role_names(record["roles"])
+        lines.append(orjson.dumps(record) + b"\n")
+    return b"".join(lines)
+
+
+def _encode_csv(rows, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    for user_id, name, surname, email, is_active, role_mask in rows:
+        roles = "|".join(_role_names(role_mask))
+        writer.writerow([user_id, name, surname, email, is_active, roles])
+    return buffer.getvalue().encode()
+
+
+async def _export_users(export_format: str, session) -> AsyncIterator[bytes]:
+    """Encode users batch by batch, memory stays flat whatever the table size"""
+    async with session.begin():
+        user_dal = get_user_dal(session)
+        if export_format == "csv":
+            yield _encode_csv([], header=True)
+        async for rows in user_dal.stream_users(
+            batch_size=settings.USER_EXPORT_BATCH_SIZE
+        ):
+            if export_format == "csv":
+                yield _encode_csv(rows)
+            else:
+                yield _encode_ndjson(rows)
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header value allows gzip, an explicit
+    ``gzip`` (or ``x-gzip``) entry takes precedence over ``*``"""
+    qvalues = {}
+    for entry in accept_encoding.split(","):
+        coding, *params = entry.split(";")
+        qvalue = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[coding.strip().lower()] = qvalue
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qvalues:
+            return qvalues[coding] > 0
+    return False
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,24 +1,44 @@
+import base64
+import binascii
+from typing import Optional
 from typing import Union
 from uuid import UUID
 
 from fastapi import HTTPException
+from sqlalchemy import false
+from sqlalchemy import true
+from sqlalchemy.engine import Row
+from sqlalchemy.sql import ColumnElement
 
+from api.actions.auth import Principal
+from api.schemas import ListUsersResponse
 from api.schemas import ShowUser
+from api.schemas import UserBatchCreate
+from api.schemas import UserBatchCreateResponse
+from api.schemas import UserBatchItemResult
 from api.schemas import UserCreate
-from db.dals import UserDAL
+from db.dals import get_user_dal
+from db.models import ALL_ROLES_MASK
+from db.models import BIT_AND
+from db.models import BIT_OR
 from db.models import PortalRole
 from db.models import User
-from hashing import Hasher
+from hashing import async_hasher
+
+ROLE_ADMIN = PortalRole.ROLE_PORTAL_ADMIN.bit
+ROLE_SUPERADMIN = PortalRole.ROLE_PORTAL_SUPERADMIN.bit
+PRIVILEGED_ROLES_MASK = ROLE_ADMIN | ROLE_SUPERADMIN
 
 
 async def _create_new_user(body: UserCreate, session) -> ShowUser:
+    hashed_password = await async_hasher.get_password_hash(body.password)
     async with session.begin():
-        user_dal = UserDAL(session)
+        user_dal = get_user_dal(session)
         user = await user_dal.create_user(
             name=body.name,
             surname=body.surname,
             email=body.email,
-            hashed_password=Hasher.get_password_hash(body.password),
+            hashed_password=hashed_password,
             roles=[
                 PortalRole.ROLE_PORTAL_USER,
             ],
@@ -33,18 +53,68 @@ async def _create_new_user(body: UserCreate, session) -> ShowUser:
         )
 
 
-async def _delete_user(user_id: id, session) -> Union[UUID, None]:
+async def _create_new_users(body: UserBatchCreate, session) -> UserBatchCreateResponse:
+    emails = [user.email for user in body.users]
+    async with session.begin():
+        user_dal = get_user_dal(session)
+        taken_emails = await user_dal.get_existing_emails(emails=emails)
+    # only the first occurrence of a free email is hashed and inserted,
+    # emails are compared case-insensitively like the unique index does
+    users_to_create = {}
+    for user in body.users:
+        lower_email = user.email.lower()
+        if lower_email not in taken_emails and lower_email not in users_to_create:
+            users_to_create[lower_email] = user
+    hashed_passwords = await async_hasher.get_password_hashes(
+        [user.password for user in users_to_create.values()]
+    )
+    async with session.begin():
+        user_dal = get_user_dal(session)
+        created_user_ids = await user_dal.bulk_create_users(
+            users=[
+                {
+                    "name": user.name,
+                    "surname": user.surname,
+                    "email": user.email,
+                    "hashed_password": hashed_password,
+                    "role_mask": PortalRole.ROLE_PORTAL_USER.bit,
+                }
+                for user, hashed_password in zip(
+                    users_to_create.values(), hashed_passwords
+                )
+            ]
+        )
+    results = []
+    for user in body.users:
+        user_id = None
+        if users_to_create.get(user.email.lower()) is user:
+            user_id = created_user_ids.get(user.email)
+        results.append(
+            UserBatchItemResult(
+                email=user.email,
+                status="created" if user_id is not None else "duplicate_email",
+                user_id=user_id,
+            )
+        )
+    return UserBatchCreateResponse(results=results)
+
+
+async def _delete_user(
+    user_id: UUID, current_user: Principal, session
+) -> Union[Row, None]:
+    """Deactivate the user in one statement if ``current_user`` may do it"""
     async with session.begin():
-        user_dal = UserDAL(session)
-        deleted_user_id = await user_dal.delete_user(
+        user_dal = get_user_dal(session)
+        return await user_dal.update_user_if(
             user_id=user_id,
+            condition=user_permissions_clause(user_id, current_user),
+            is_active=False,
         )
-        return deleted_user_id
 
 
 async def _get_user_by_id(user_id, session) -> Union[User, None]:
     async with session.begin():
-        user_dal = UserDAL(session)
+        user_dal = get_user_dal(session)
         user = await user_dal.get_user_by_id(
             user_id=user_id,
         )
@@ -52,42 +122,141 @@ async def _get_user_by_id(user_id, session) -> Union[User, None]:
             return user
 
 
+def _encode_cursor(user_id: UUID) -> str:
+    return base64.urlsafe_b64encode(user_id.bytes).rstrip(b"=").decode()
+
+
+def _decode_cursor(cursor: str) -> UUID:
+    try:
+        return UUID(bytes=base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+async def _list_users(
+    limit: int,
+    cursor: Optional[str],
+    is_active: Optional[bool],
+    role: Optional[PortalRole],
+    session,
+) -> ListUsersResponse:
+    after_user_id = _decode_cursor(cursor) if cursor is not None else None
+    async with session.begin():
+        user_dal = get_user_dal(session)
+        users = await user_dal.list_users(
+            limit=limit + 1,
+            after_user_id=after_user_id,
+            is_active=is_active,
+            role=role,
+        )
+    return _users_page(users, limit)
+
+
+async def _list_users_by_role(
+    role: PortalRole, limit: int, cursor: Optional[str], session
+) -> ListUsersResponse:
+    after_user_id = _decode_cursor(cursor) if cursor is not None else None
+    async with session.begin():
+        user_dal = get_user_dal(session)
+        users = await user_dal.list_users_by_role(
+            role=role, limit=limit + 1, after_user_id=after_user_id
+        )
+    return _users_page(users, limit)
+
+
+def _users_page(users: list[User], limit: int) -> ListUsersResponse:
+    """Build a page out of ``limit + 1`` fetched users, the extra one only
+    tells whether there is a next page"""
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = _encode_cursor(users[-1].user_id)
+    return ListUsersResponse(users=users, next_cursor=next_cursor)
+
+
 async def _update_user(
-    updated_user_params: dict, user_id: UUID, session
-) -> Union[UUID, None]:
+    updated_user_params: dict, user_id: UUID, current_user: Principal, session
+) -> Union[Row, None]:
+    if user_id == current_user.user_id:
+        condition = true()
+    else:
+        condition = user_permissions_clause(user_id, current_user)
+    async with session.begin():
+        user_dal = get_user_dal(session)
+        return await user_dal.update_user_if(
+            user_id=user_id, condition=condition, **updated_user_params
+        )
+
+
+async def _grant_admin_role(user_id: UUID, session) -> Union[Row, None]:
     async with session.begin():
-        user_dal = UserDAL(session)
-        updated_user_id = await user_dal.update_user(
-            user_id=user_id, **updated_user_params
+        user_dal = get_user_dal(session)
+        return await user_dal.update_user_if(
+            user_id=user_id,
+            condition=BIT_AND(User.role_mask, PRIVILEGED_ROLES_MASK) == 0,
+            role_mask=BIT_OR(User.role_mask, ROLE_ADMIN),
         )
-        return updated_user_id
 
 
-def check_user_permissions(target_user: User, current_user: User) -> bool:
-    if PortalRole.ROLE_PORTAL_SUPERADMIN in current_user.roles:
+async def _revoke_admin_role(user_id: UUID, session) -> Union[Row, None]:
+    async with session.begin():
+        user_dal = get_user_dal(session)
+        return await user_dal.update_user_if(
+            user_id=user_id,
+            condition=BIT_AND(User.role_mask, ROLE_ADMIN) != 0,
+            role_mask=BIT_AND(User.role_mask, ~ROLE_ADMIN),
+        )
+
+
+def _forbidden_target_roles(current_user_mask: int) -> Union[int, None]:
+    """Role bits that put another user out of reach, None if every other
+    user is out of reach"""
+    if not current_user_mask & PRIVILEGED_ROLES_MASK:
+        return None
+    if current_user_mask & ROLE_ADMIN:
+        # admin can't deactivate superadmin or another admin
+        return PRIVILEGED_ROLES_MASK
+    return 0
+
+
+# both tables are indexed by role masks, so a check is a couple of lookups
+FORBIDDEN_TARGET_ROLES = tuple(
+    _forbidden_target_roles(mask) for mask in range(ALL_ROLES_MASK + 1)
+)
+PERMISSION_MATRIX = tuple(
+    tuple(
+        forbidden is not None and not target_mask & forbidden
+        for target_mask in range(ALL_ROLES_MASK + 1)
+    )
+    for forbidden in FORBIDDEN_TARGET_ROLES
+)
+
+
+def user_permissions_clause(
+    target_user_id: UUID, current_user: Principal
+) -> ColumnElement:
+    """``check_user_permissions`` as a SQL condition on the target row.
+
+    A superadmin gets a false condition, the handler answers 406 for it
+    once it knows that the target exists.
+    """
+    if current_user.role_mask & ROLE_SUPERADMIN:
+        return false()
+    if target_user_id == current_user.user_id:
+        return true()
+    forbidden = FORBIDDEN_TARGET_ROLES[current_user.role_mask & ALL_ROLES_MASK]
+    if forbidden is None:
+        return false()
+    return BIT_AND(User.role_mask, forbidden) == 0
+
+
+def check_user_permissions(target_user: Row, current_user: Principal) -> bool:
+    if current_user.role_mask & ROLE_SUPERADMIN:
         raise HTTPException(
             status_code=406, detail="Superadmin cannot be deleted via API"
         )
     if target_user.user_id != current_user.user_id:
-        # check admin role
-        if not {
-            PortalRole.ROLE_PORTAL_ADMIN,
-            PortalRole.ROLE_PORTAL_SUPERADMIN,
-        }.intersection(current_user.roles):
-            return False
-
-        # check admin deactivate superadmin attempt
-        if (
-            PortalRole.ROLE_PORTAL_SUPERADMIN in target_user.roles
-            and PortalRole.ROLE_PORTAL_ADMIN in current_user.roles
-        ):
-            return False
-
-        # check admin deactivate admin attempt
-        if (
-            PortalRole.ROLE_PORTAL_ADMIN in target_user.roles
-            and PortalRole.ROLE_PORTAL_ADMIN in current_user.roles
-        ):
-            return False
-
+        return PERMISSION_MATRIX[current_user.role_mask & ALL_ROLES_MASK][
+            target_user.role_mask & ALL_ROLES_MASK
+        ]
     return True
@@ -1,25 +1,47 @@
 from logging import getLogger
+from typing import Optional
 from uuid import UUID
 
 from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import HTTPException
+from fastapi import Query
+from fastapi import Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import settings
 from api.actions.auth import get_current_user_from_token
+from api.actions.auth import Principal
+from api.actions.export import _export_users
+from api.actions.export import accepts_gzip
+from api.actions.export import EXPORT_MEDIA_TYPES
+from api.actions.export import gzip_chunks
 from api.actions.user import _create_new_user
+from api.actions.user import _create_new_users
 from api.actions.user import _delete_user
 from api.actions.user import _get_user_by_id
+from api.actions.user import _grant_admin_role
+from api.actions.user import _list_users
+from api.actions.user import _list_users_by_role
+from api.actions.user import _revoke_admin_role
 from api.actions.user import _update_user
 from api.actions.user import check_user_permissions
+from api.actions.user import PRIVILEGED_ROLES_MASK
+from api.responses import SchemaResponse
 from api.schemas import DeleteUserResponse
+from api.schemas import ListUsersResponse
 from api.schemas import ShowUser
 from api.schemas import UpdatedUserResponse
 from api.schemas import UpdateUserRequest
+from api.schemas import UserBatchCreate
+from api.schemas import UserBatchCreateResponse
 from api.schemas import UserCreate
-from db.models import User
+from db.models import PortalRole
 from db.session import get_db
+from db.session import get_read_db
+from hashing import HashingQueueFull
 
 logger = getLogger(__name__)
 
@@ -27,44 +49,124 @@ user_router = APIRouter()
 
 
 @user_router.post("/", response_model=ShowUser)
-async def create_user(body: UserCreate, db: AsyncSession = Depends(get_db)) -> ShowUser:
+async def create_user(
+    body: UserCreate, db: AsyncSession = Depends(get_db)
+) -> SchemaResponse:
     try:
-        return await _create_new_user(body, db)
+        return SchemaResponse(await _create_new_user(body, db))
     except IntegrityError as err:
         logger.error(err)
         raise HTTPException(status_code=503, detail=f"Database error: {err}")
+    except HashingQueueFull as err:
+        logger.warning(err)
+        raise HTTPException(status_code=503, detail=str(err))
+
+
+@user_router.post("/batch", response_model=UserBatchCreateResponse)
+async def create_users_batch(
+    body: UserBatchCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user_from_token),
+) -> SchemaResponse:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    try:
+        return SchemaResponse(await _create_new_users(body, db))
+    except HashingQueueFull as err:
+        logger.warning(err)
+        raise HTTPException(status_code=503, detail=str(err))
 
 
 @user_router.delete("/", response_model=DeleteUserResponse)
 async def delete_user(
     user_id: UUID,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user_from_token),
-) -> DeleteUserResponse:
-    user_for_deletion = await _get_user_by_id(user_id, db)
-    if user_for_deletion is None:
+    current_user: Principal = Depends(get_current_user_from_token),
+) -> SchemaResponse:
+    user_row = await _delete_user(user_id, current_user, db)
+    if user_row is None:
         raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
-    if not check_user_permissions(
-        target_user=user_for_deletion,
-        current_user=current_user,
-    ):
-        raise HTTPException(status_code=403, detail="Forbidden")
-    deleted_user_id = await _delete_user(user_id, db)
-    if deleted_user_id is None:
+    if user_row.updated_user_id is None:
+        if not check_user_permissions(
+            target_user=user_row,
+            current_user=current_user,
+        ):
+            raise HTTPException(status_code=403, detail="Forbidden")
         raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
-    return DeleteUserResponse(deleted_user_id=deleted_user_id)
+    return SchemaResponse(DeleteUserResponse(deleted_user_id=user_row.updated_user_id))
 
 
 @user_router.get("/", response_model=ShowUser)
 async def get_user_by_id(
     user_id: UUID,
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user_from_token),
-) -> ShowUser:
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user_from_token),
+) -> SchemaResponse:
     user = await _get_user_by_id(user_id, db)
     if user is None:
         raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
-    return user
+    return SchemaResponse(ShowUser.from_orm(user))
+
+
+@user_router.get("/list", response_model=ListUsersResponse)
+async def list_users(
+    cursor: Optional[str] = None,
+    limit: int = Query(
+        default=settings.USER_LIST_DEFAULT_LIMIT, ge=1, le=settings.USER_LIST_MAX_LIMIT
+    ),
+    is_active: Optional[bool] = None,
+    role: Optional[PortalRole] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user_from_token),
+) -> SchemaResponse:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    return SchemaResponse(
+        await _list_users(
+            limit=limit, cursor=cursor, is_active=is_active, role=role, session=db
+        )
+    )
+
+
+@user_router.get("/by_role", response_model=ListUsersResponse)
+async def list_users_by_role(
+    role: PortalRole,
+    cursor: Optional[str] = None,
+    limit: int = Query(
+        default=settings.USER_LIST_DEFAULT_LIMIT, ge=1, le=settings.USER_LIST_MAX_LIMIT
+    ),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user_from_token),
+) -> SchemaResponse:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    return SchemaResponse(
+        await _list_users_by_role(role=role, limit=limit, cursor=cursor, session=db)
+    )
+
+
+@user_router.get("/export")
+async def export_users(
+    request: Request,
+    export_format: str = Query(
+        default="ndjson", alias="format", regex="^(ndjson|csv)$"
+    ),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user_from_token),
+) -> StreamingResponse:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    chunks = _export_users(export_format, db)
+    headers = {
+        "Content-Disposition": f'attachment; filename="users.{export_format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if accepts_gzip(request.headers.get("accept-encoding", "")):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        chunks, media_type=EXPORT_MEDIA_TYPES[export_format], headers=headers
+    )
 
 
 @user_router.patch("/", response_model=UpdatedUserResponse)
@@ -72,35 +174,41 @@ async def update_user_by_id(
     user_id: UUID,
     body: UpdateUserRequest,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user_from_token),
-) -> UpdatedUserResponse:
-    if body.dict(exclude_none=True) == {}:
+    current_user: Principal = Depends(get_current_user_from_token),
+) -> SchemaResponse:
+    updated_user_params = body.dict(exclude_none=True)
+    if updated_user_params == {}:
         raise HTTPException(
             status_code=422,
             detail="At least one parameter for user update info should be provided",
         )
-    user_for_update = await _get_user_by_id(user_id, db)
-    if user_for_update is None:
-        raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
-    if user_id != current_user.user_id:
-        if check_user_permissions(
-            target_user=user_for_update,
-            current_user=current_user,
-        ):
-            raise HTTPException(status_code=403, detail="Forbidden")
     try:
-        updated_user_id = await _update_user(body=body, db=db, user_id=user_id)
+        user_row = await _update_user(
+            updated_user_params=updated_user_params,
+            user_id=user_id,
+            current_user=current_user,
+            session=db,
+        )
     except IntegrityError as err:
         logger.error(err)
         raise HTTPException(status_code=503, detail=f"Database error: {err}")
-    return UpdatedUserResponse(update_user_id=updated_user_id)
+    if user_row is None:
+        raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
+    if user_row.updated_user_id is None:
+        if user_id != current_user.user_id and not check_user_permissions(
+            target_user=user_row,
+            current_user=current_user,
+        ):
+            raise HTTPException(status_code=403, detail="Forbidden")
+        raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
+    return SchemaResponse(UpdatedUserResponse(updated_user_id=user_row.updated_user_id))
 
 
 @user_router.patch("/admin_privilege", response_model=UpdatedUserResponse)
 async def grant_admin_privilege(
     user_id: UUID,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user_from_token),
+    current_user: Principal = Depends(get_current_user_from_token),
 ):
     if not current_user.is_superadmin:
         raise HTTPException(status_code=403, detail="Forbidden.")
@@ -108,34 +216,28 @@ async def grant_admin_privilege(
         raise HTTPException(
             status_code=400, detail="Cannot manage privileges of itself."
         )
-    user_for_promotion = await _get_user_by_id(user_id, db)
-    if user_for_promotion.is_admin or user_for_promotion.is_superadmin:
+    user_row = await _grant_admin_role(user_id, db)
+    if user_row is None:
         raise HTTPException(
-            status_code=409,
-            detail=f"User with id {user_id} already promoted to admin / superadmin.",
+            status_code=404, detail=f"User with id {user_id} not found."
         )
-    if user_for_promotion is None:
+    if user_row.updated_user_id is None:
+        if user_row.role_mask & PRIVILEGED_ROLES_MASK:
+            raise HTTPException(
+                status_code=409,
+                detail=f"User with id {user_id} already promoted to admin / superadmin.",
+            )
         raise HTTPException(
             status_code=404, detail=f"User with id {user_id} not found."
         )
-    updated_user_params = {
-        "roles": user_for_promotion.enrich_admin_roles_by_admin_role()
-    }
-    try:
-        updated_user_id = await _update_user(
-            updated_user_params=updated_user_params, session=db, user_id=user_id
-        )
-    except IntegrityError as err:
-        logger.error(err)
-        raise HTTPException(status_code=503, detail=f"Database error: {err}")
-    return UpdatedUserResponse(updated_user_id=updated_user_id)
+    return SchemaResponse(UpdatedUserResponse(updated_user_id=user_row.updated_user_id))
 
 
 @user_router.delete("/admin_privilege", response_model=UpdatedUserResponse)
 async def revoke_admin_privilege(
     user_id: UUID,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user_from_token),
+    current_user: Principal = Depends(get_current_user_from_token),
 ):
     if not current_user.is_superadmin:
         raise HTTPException(status_code=403, detail="Forbidden.")
@@ -143,23 +245,18 @@ async def revoke_admin_privilege(
         raise HTTPException(
             status_code=400, detail="Cannot manage privileges of itself."
         )
-    user_for_revoke_admin_privileges = await _get_user_by_id(user_id, db)
-    if not user_for_revoke_admin_privileges.is_admin:
+    user_row = await _revoke_admin_role(user_id, db)
+    if user_row is None:
         raise HTTPException(
-            status_code=409, detail=f"User with id {user_id} has no admin privileges."
+            status_code=404, detail=f"User with id {user_id} not found."
         )
-    if user_for_revoke_admin_privileges is None:
+    if user_row.updated_user_id is None:
+        if not user_row.role_mask & PortalRole.ROLE_PORTAL_ADMIN.bit:
+            raise HTTPException(
+                status_code=409,
+                detail=f"User with id {user_id} has no admin privileges.",
+            )
         raise HTTPException(
             status_code=404, detail=f"User with id {user_id} not found."
         )
-    updated_user_params = {
-        "roles": user_for_revoke_admin_privileges.remove_admin_privileges_from_model()
-    }
-    try:
-        updated_user_id = await _update_user(
-            updated_user_params=updated_user_params, session=db, user_id=user_id
-        )
-    except IntegrityError as err:
-        logger.error(err)
-        raise HTTPException(status_code=503, detail=f"Database error: {err}")
-    return UpdatedUserResponse(updated_user_id=updated_user_id)
+    return SchemaResponse(UpdatedUserResponse(updated_user_id=user_row.updated_user_id))
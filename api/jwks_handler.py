@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+from fastapi import Request
+from fastapi import Response
+from starlette import status
+
+import settings
+from security import key_set
+
+jwks_router = APIRouter()
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+@jwks_router.get("/.well-known/jwks.json")
+async def get_jwks(request: Request) -> Response:
+    """Public keys of the signing key ids, for services verifying tokens
+    themselves"""
+    headers = {
+        "Cache-Control": f"public, max-age={settings.JWKS_MAX_AGE_SECONDS}",
+        "ETag": key_set.jwks_etag,
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and _etag_matches(if_none_match, key_set.jwks_etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(key_set.jwks_body, media_type="application/json", headers=headers)
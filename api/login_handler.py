@@ -1,53 +1,96 @@
-from datetime import timedelta
-from typing import Union
+import math
+from typing import Optional
 
 from fastapi import APIRouter
+from fastapi import BackgroundTasks
 from fastapi import Depends
 from fastapi import HTTPException
+from fastapi import Request
+from fastapi import Response
 from fastapi import status
-from fastapi.security import OAuth2PasswordBearer
 from fastapi.security import OAuth2PasswordRequestForm
-from jose import jwt
-from jose import JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-import settings
-from api.schemas import Token
-from db.dals import UserDAL
-from db.models import User
-from db.session import get_db
-from hashing import Hasher
-from security import create_access_token
-
 from api.actions.auth import authenticate_user
 from api.actions.auth import get_current_user_from_token
+from api.actions.auth import issue_tokens
+from api.actions.auth import oauth2_scheme
+from api.actions.auth import Principal
+from api.actions.auth import refresh_tokens
+from api.actions.auth import revoke_token
+from api.schemas import RefreshTokenRequest
+from api.schemas import ShowPrincipal
 from api.schemas import Token
 from db.session import get_db
-from security import create_access_token
+from hashing import HashingQueueFull
+from throttling import login_throttle
 
 login_router = APIRouter()
 
-    
-@login_router.post("/token", response_model=Token)
+
+@login_router.post("/token", response_model=Token, response_model_exclude_none=True)
 async def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)
+    request: Request,
+    background_tasks: BackgroundTasks,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = await authenticate_user(form_data.username, form_data.password, db)
+    if login_throttle is not None:
+        # behind a proxy the address is only right with uvicorn --proxy-headers
+        client_ip = request.client.host if request.client else None
+        retry_after = await login_throttle.check(client_ip, form_data.username)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+    try:
+        user = await authenticate_user(
+            form_data.username, form_data.password, db, background_tasks
+        )
+    except HashingQueueFull as err:
+        raise HTTPException(status_code=503, detail=str(err))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
-            )
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data = {"sub": user.email, "other_custom_data": [1,2,3,4]},
-        expires_delta = access_token_expires,
-    )                              
-    return {"access_token": access_token, "token_type": "bearer"}
+        )
+    return issue_tokens(user)
+
+
+@login_router.post("/refresh", response_model=Token, response_model_exclude_none=True)
+async def refresh_access_token(
+    body: RefreshTokenRequest, db: AsyncSession = Depends(get_db)
+):
+    tokens = await refresh_tokens(body.refresh_token, db)
+    if tokens is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+        )
+    return tokens
+
+
+@login_router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    body: Optional[RefreshTokenRequest] = None,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+):
+    """Revoke the bearer token, and the refresh token if one is given"""
+    if not await revoke_token(token, db):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+        )
+    if body is not None:
+        await revoke_token(body.refresh_token, db)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @login_router.get("/test_auth_endpoint")
 async def sample_endpoint_under_jwt(
-    current_user: User = Depends(get_current_user_from_token)
+    current_user: Principal = Depends(get_current_user_from_token),
 ):
-    return {"Success": True, "current_user": current_user}
\ No newline at end of file
+    return {"Success": True, "current_user": ShowPrincipal.from_orm(current_user)}
@@ -0,0 +1,28 @@
+from typing import Any
+from uuid import UUID
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+def _default(obj: Any):
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, UUID):
+        # asyncpg returns its own UUID subclass, which orjson doesn't know
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class SchemaResponse(ORJSONResponse):
+    """Encodes an already validated schema straight to bytes.
+
+    Returning a response from a handler makes FastAPI skip the
+    ``response_model`` validation and ``jsonable_encoder`` passes, which
+    would otherwise rebuild the same schema and walk it again. The
+    ``response_model`` stays on the route for the OpenAPI docs.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default)
@@ -4,10 +4,14 @@ from typing import Optional
 
 from fastapi import HTTPException
 from pydantic import BaseModel
+from pydantic import conlist
 from pydantic import constr
 from pydantic import EmailStr
 from pydantic import validator
 
+import settings
+from db.models import PortalRole
+
 LETTER_MATCH_PATTERN = re.compile(r"^[а-яА-Яa-zA-Z\-]+$")
 
 
@@ -26,6 +30,15 @@ class ShowUser(TunedModel):
     is_active: bool
 
 
+class ShowPrincipal(TunedModel):
+    user_id: uuid.UUID
+    email: EmailStr
+    roles: list[PortalRole]
+    is_active: bool
+    is_admin: bool
+    is_superadmin: bool
+
+
 class UserCreate(TunedModel):
     name: str
     surname: str
@@ -51,6 +64,25 @@ class UserCreate(TunedModel):
         return value
 
 
+class ListUsersResponse(BaseModel):
+    users: list[ShowUser]
+    next_cursor: Optional[str]
+
+
+class UserBatchCreate(BaseModel):
+    users: conlist(UserCreate, min_items=1, max_items=settings.USER_BATCH_MAX_SIZE)
+
+
+class UserBatchItemResult(BaseModel):
+    email: EmailStr
+    status: str
+    user_id: Optional[uuid.UUID]
+
+
+class UserBatchCreateResponse(BaseModel):
+    results: list[UserBatchItemResult]
+
+
 class DeleteUserResponse(BaseModel):
     deleted_user_id: uuid.UUID
 
@@ -84,3 +116,8 @@ class UpdateUserRequest(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
@@ -0,0 +1,95 @@
+"""Per-call Python overhead of the UserDAL statements, no database needed.
+
+Times what SQLAlchemy does for a statement before anything is sent to the
+driver: building the construct, generating its cache key and looking the
+compiled form up in the engine's compiled cache. "rebuilt" builds the
+statement on every call the way the DAL used to, "prebuilt" reuses the
+module-level statement from ``db.dals``.
+
+    python benchmarks/bench_dal_statements.py --number 5000
+"""
+import argparse
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql.asyncpg import dialect
+
+from db import dals
+from db.models import has_role
+from db.models import PortalRole
+from db.models import User
+
+DIALECT = dialect()
+
+
+def _get_user_by_id():
+    return select(User).where(User.user_id == uuid.uuid4())
+
+
+def _get_auth_record_by_email():
+    return select(
+        User.user_id,
+        User.email,
+        User.hashed_password,
+        User.role_mask,
+        User.is_active,
+        User.token_version,
+    ).where(func.lower(User.email) == "someone@example.com")
+
+
+def _list_users_by_role():
+    return (
+        select(User)
+        .where(has_role(PortalRole.ROLE_PORTAL_ADMIN))
+        .where(User.user_id > uuid.uuid4())
+        .order_by(User.user_id)
+        .limit(50)
+    )
+
+
+CASES = {
+    "get_user_by_id": (_get_user_by_id, lambda: dals._SELECT_USER_BY_ID),
+    "get_auth_record_by_email": (
+        _get_auth_record_by_email,
+        lambda: dals._SELECT_AUTH_RECORD_BY_EMAIL,
+    ),
+    "list_users_by_role": (
+        _list_users_by_role,
+        lambda: dals._list_users_query(True, False, PortalRole.ROLE_PORTAL_ADMIN),
+    ),
+}
+
+
+def _per_call(make_statement, number: int, repeat: int) -> float:
+    compiled_cache = {}
+
+    def call():
+        make_statement()._compile_w_cache(
+            DIALECT, compiled_cache=compiled_cache, column_keys=[]
+        )
+
+    call()  # warm the compiled cache, as a running app has
+    return min(timeit.repeat(call, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'statement':<26}{'rebuilt, us':>14}{'prebuilt, us':>14}{'speedup':>10}")
+    for name, (rebuilt, prebuilt) in CASES.items():
+        before = _per_call(rebuilt, args.number, args.repeat) * 1e6
+        after = _per_call(prebuilt, args.number, args.repeat) * 1e6
+        print(f"{name:<26}{before:>14.1f}{after:>14.1f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
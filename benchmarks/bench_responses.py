@@ -0,0 +1,110 @@
+"""CPU spent turning a handler result into response bytes.
+
+"response_model" is FastAPI's own path: the handler returns an object, the
+route validates it against ``response_model``, runs ``jsonable_encoder``
+and renders a ``JSONResponse``. "SchemaResponse" validates the schema once
+and encodes it with orjson, as the handlers in ``api/handlers.py`` do.
+
+    python benchmarks/bench_responses.py --number 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from fastapi.routing import serialize_response
+
+from api.actions.user import _users_page
+from api.responses import SchemaResponse
+from api.schemas import ListUsersResponse
+from api.schemas import ShowUser
+from db.models import User
+from db.records import UserRecord
+
+
+def _user_values(number: int) -> dict:
+    return {
+        "user_id": uuid.uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": f"user{number}@example.com",
+        "is_active": True,
+        "hashed_password": "$2b$12$" + "x" * 53,
+        "role_mask": 1,
+    }
+
+
+def _response_field(response_model):
+    route = APIRoute("/", endpoint=lambda: None, response_model=response_model)
+    return route.secure_cloned_response_field
+
+
+async def _via_response_model(field, content):
+    body = await serialize_response(field=field, response_content=content)
+    return JSONResponse(body).body
+
+
+async def _via_schema_response(schema, content):
+    return SchemaResponse(schema(content)).body
+
+
+def _cases(page_size: int) -> dict:
+    orm_user = User(**_user_values(0))
+    records = [UserRecord(**_user_values(number)) for number in range(page_size)]
+    show_user_field = _response_field(ShowUser)
+    page_field = _response_field(ListUsersResponse)
+    return {
+        # GET /user/ used to return the ORM object
+        "ShowUser from ORM User": (
+            lambda: _via_response_model(show_user_field, orm_user),
+            lambda: _via_schema_response(ShowUser.from_orm, orm_user),
+        ),
+        # POST /user/ used to return a ShowUser built by hand
+        "ShowUser built by hand": (
+            lambda: _via_response_model(show_user_field, ShowUser.from_orm(orm_user)),
+            lambda: _via_schema_response(ShowUser.from_orm, orm_user),
+        ),
+        f"ListUsersResponse, {page_size} users": (
+            lambda: _via_response_model(page_field, _users_page(records, page_size)),
+            lambda: _via_schema_response(
+                lambda users: _users_page(users, page_size), records
+            ),
+        ),
+    }
+
+
+async def _per_call(make_body, number: int, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        for _ in range(number):
+            await make_body()
+        timings.append(time.perf_counter() - started_at)
+    return min(timings) / number
+
+
+async def _run(args: argparse.Namespace):
+    print(f"{'response':<32}{'response_model, us':>20}{'SchemaResponse, us':>20}")
+    for name, (before, after) in _cases(args.page_size).items():
+        assert await before() == await after(), name
+        before_us = await _per_call(before, args.number, args.repeat) * 1e6
+        after_us = await _per_call(after, args.number, args.repeat) * 1e6
+        print(f"{name:<32}{before_us:>20.1f}{after_us:>20.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=50)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
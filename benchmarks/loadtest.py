@@ -0,0 +1,325 @@
+"""Open-loop HTTP load test of the user and login endpoints.
+
+Seeds users straight into Postgres, mints their tokens with
+``create_access_token`` and fires requests at a fixed arrival rate, drawn
+from one of the mixes below. Latency is measured from the moment a request
+was due rather than from when it was sent, so a stalled server shows up in
+the percentiles instead of silently lowering the load.
+
+Without ``--base-url`` the app runs in-process through httpx's ASGI
+transport and talks to ``REAL_DATABASE_URL``; with it, requests go to a
+running server, which must use the database given by ``--database-url``.
+
+Every request comes from the one address of the load generator, so the
+login throttle would turn most logins into 429s and the run would measure
+the throttle instead of the login path. In-process it is switched off
+unless ``--login-throttle`` is given; a server under test should run with
+``LOGIN_THROTTLE_ENABLED=false``.
+
+    python benchmarks/loadtest.py --mix read-heavy --rate 200 --duration 30 \\
+        -o results/read-heavy.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from datetime import timezone
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncpg
+import httpx
+
+import settings
+from db.models import ALL_ROLES_MASK
+from hashing import Hasher
+from manage import _asyncpg_dsn
+from manage import USER_COLUMNS
+from security import create_access_token
+
+PASSWORD = "loadtest-password"
+
+# weights of the operations in each mix
+MIXES = {
+    "login-heavy": {"login": 70, "get_user": 20, "update_user": 10},
+    "read-heavy": {"get_user": 70, "list_users": 20, "login": 5, "update_user": 5},
+    "write-heavy": {"create_user": 50, "update_user": 40, "get_user": 10},
+}
+# route each operation is reported under
+ROUTES = {
+    "login": "POST /login/token",
+    "get_user": "GET /user/",
+    "list_users": "GET /user/list",
+    "create_user": "POST /user/",
+    "update_user": "PATCH /user/",
+}
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, users: list[dict], run_id: str):
+        self.client = client
+        self.users = users
+        self.admin = users[0]
+        self.run_id = run_id
+        self._created = itertools.count()
+
+    async def login(self):
+        user = random.choice(self.users)
+        return await self.client.post(
+            "/login/token", data={"username": user["email"], "password": PASSWORD}
+        )
+
+    async def get_user(self):
+        user = random.choice(self.users)
+        target = random.choice(self.users)
+        return await self.client.get(
+            "/user/", params={"user_id": target["user_id"]}, headers=user["headers"]
+        )
+
+    async def list_users(self):
+        return await self.client.get(
+            "/user/list", params={"limit": 50}, headers=self.admin["headers"]
+        )
+
+    async def create_user(self):
+        return await self.client.post(
+            "/user/",
+            json={
+                "name": "Load",
+                "surname": "Test",
+                "email": f"loadtest-{self.run_id}-new{next(self._created)}@example.com",
+                "password": PASSWORD,
+            },
+        )
+
+    async def update_user(self):
+        user = random.choice(self.users)
+        return await self.client.patch(
+            "/user/",
+            params={"user_id": user["user_id"]},
+            json={"name": random.choice(["Load", "Loaded", "Loading"])},
+            headers=user["headers"],
+        )
+
+
+async def seed_users(connection, count: int, run_id: str) -> list[dict]:
+    """Insert ``count`` users sharing one password, the first one is a
+    superadmin so it can list users"""
+    hashed_password = Hasher.get_password_hash(PASSWORD)
+    users = []
+    records = []
+    for number in range(count):
+        values = {
+            "user_id": uuid.uuid4(),
+            "name": "Load",
+            "surname": "Test",
+            "email": f"loadtest-{run_id}-{number}@example.com",
+            "is_active": True,
+            "hashed_password": hashed_password,
+            "role_mask": ALL_ROLES_MASK if number == 0 else 1,
+            "token_version": 0,
+        }
+        records.append(tuple(values[column] for column in USER_COLUMNS))
+        token = create_access_token({"sub": values["email"]})
+        users.append(
+            {
+                "user_id": str(values["user_id"]),
+                "email": values["email"],
+                "headers": {"Authorization": f"Bearer {token}"},
+            }
+        )
+    await connection.copy_records_to_table(
+        "users", records=records, columns=USER_COLUMNS
+    )
+    return users
+
+
+def percentile(sorted_values: list[float], percent: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list, None if empty"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(percent / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else seconds * 1000
+
+
+def _format_ms(value: Optional[float]) -> str:
+    return f"{'-':>7}" if value is None else f"{value:7.1f}"
+
+
+def summarize(samples: dict, dropped: dict, duration: float) -> dict:
+    """Per route figures; dropped requests have no latency, so they are
+    reported next to the percentiles, which would look better without them"""
+    routes = {}
+    for route in sorted(samples.keys() | dropped.keys()):
+        route_samples = samples.get(route, [])
+        latencies = sorted(latency for latency, _ in route_samples)
+        statuses = defaultdict(int)
+        for _, status in route_samples:
+            statuses[str(status)] += 1
+        routes[route] = {
+            "requests": len(route_samples),
+            "rps": len(route_samples) / duration,
+            "errors": sum(
+                count
+                for status, count in statuses.items()
+                if not status.isdigit() or int(status) >= 400
+            ),
+            "statuses": dict(statuses),
+            "dropped": dropped.get(route, 0),
+            "p50_ms": _ms(percentile(latencies, 50)),
+            "p95_ms": _ms(percentile(latencies, 95)),
+            "p99_ms": _ms(percentile(latencies, 99)),
+            "max_ms": _ms(percentile(latencies, 100)),
+        }
+    return routes
+
+
+async def run(
+    load_test: LoadTest, mix: dict, rate: float, duration: float, max_in_flight: int
+) -> tuple[dict, dict, float]:
+    operations = [getattr(load_test, name) for name in mix]
+    weights = list(mix.values())
+    samples = defaultdict(list)
+    in_flight = set()
+    dropped = defaultdict(int)
+
+    async def fire(operation, due: float):
+        try:
+            status = (await operation()).status_code
+        except httpx.HTTPError as err:
+            status = type(err).__name__
+        samples[ROUTES[operation.__name__]].append((time.perf_counter() - due, status))
+
+    started_at = time.perf_counter()
+    for number in range(int(rate * duration)):
+        due = started_at + number / rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        operation = random.choices(operations, weights)[0]
+        if len(in_flight) >= max_in_flight:
+            dropped[ROUTES[operation.__name__]] += 1
+            continue
+        task = asyncio.create_task(fire(operation, due))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.wait(in_flight)
+    return samples, dropped, time.perf_counter() - started_at
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main_async(args: argparse.Namespace):
+    run_id = uuid.uuid4().hex[:8]
+    connection = await asyncpg.connect(_asyncpg_dsn(args.database_url))
+    app = None
+    try:
+        users = await seed_users(connection, args.users, run_id)
+        if args.base_url:
+            client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+        else:
+            from api import login_handler
+            from main import app
+
+            if not args.login_throttle:
+                login_handler.login_throttle = None
+            await app.router.startup()
+            client = httpx.AsyncClient(
+                app=app, base_url="http://loadtest", timeout=args.timeout
+            )
+        async with client:
+            samples, dropped, elapsed = await run(
+                LoadTest(client, users, run_id),
+                MIXES[args.mix],
+                rate=args.rate,
+                duration=args.duration,
+                max_in_flight=args.max_in_flight,
+            )
+    finally:
+        if app is not None:
+            await app.router.shutdown()
+        if not args.keep_users:
+            await connection.execute(
+                "DELETE FROM users WHERE email LIKE $1", f"loadtest-{run_id}-%"
+            )
+        await connection.close()
+
+    report = {
+        "commit": _git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "target": args.base_url or "in-process",
+        "mix": args.mix,
+        "rate": args.rate,
+        "duration_s": elapsed,
+        "users": args.users,
+        "dropped": sum(dropped.values()),
+        "total_rps": sum(len(route) for route in samples.values()) / elapsed,
+        "routes": summarize(samples, dropped, elapsed),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    for route, stats in report["routes"].items():
+        latencies = "  ".join(
+            f"{name} {_format_ms(stats[name + '_ms'])} ms"
+            for name in ("p50", "p95", "p99")
+        )
+        print(
+            f"{route:<20} {stats['rps']:8.1f} rps  {latencies}  "
+            f"dropped {stats['dropped']}  errors {stats['errors']}",
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", choices=sorted(MIXES), default="read-heavy")
+    parser.add_argument("--rate", type=float, default=100, help="requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--users", type=int, default=1000, help="users to seed")
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=1000,
+        help="requests due while this many are pending are dropped and counted",
+    )
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--base-url", help="running server, in-process app if unset")
+    parser.add_argument("--database-url", default=settings.REAL_DATABASE_URL)
+    parser.add_argument("--keep-users", action="store_true")
+    parser.add_argument(
+        "--login-throttle",
+        action="store_true",
+        help="keep the login throttle of the in-process app on",
+    )
+    parser.add_argument("-o", "--output", default="-")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Per-request CPU cost of the auth and validation hot paths.
+
+Runs apart from the test suite, against a saved baseline:
+
+    make bench_baseline   # save the current numbers
+    make bench_check      # fail if a median got more than BENCH_THRESHOLD worse
+"""
+import os
+import sys
+import uuid
+from collections import namedtuple
+
+import pytest
+from jose import jwt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashing
+from api.actions.auth import Principal
+from api.actions.user import check_user_permissions
+from api.responses import SchemaResponse
+from api.schemas import ShowUser
+from api.schemas import UpdateUserRequest
+from api.schemas import UserCreate
+from db.models import PortalRole
+from db.records import UserRecord
+from hashing import Hasher
+from revocation import RevocationList
+from security import create_access_token
+from security import decode_access_token
+from security import key_set
+
+PASSWORD = "benchmark-password"
+BCRYPT_ROUNDS = [4, 10, 12]
+
+TargetRow = namedtuple("TargetRow", ["user_id", "role_mask"])
+
+
+@pytest.fixture
+def user_record() -> UserRecord:
+    return UserRecord(
+        user_id=uuid.uuid4(),
+        name="Alisher",
+        surname="Yertayev",
+        email="alisherertaev@gmail.com",
+        is_active=True,
+        hashed_password="hashed",
+        role_mask=PortalRole.ROLE_PORTAL_USER.bit,
+    )
+
+
+@pytest.mark.parametrize("rounds", BCRYPT_ROUNDS)
+def test_verify_password(benchmark, rounds):
+    hashed_password = hashing.make_pwd_context(rounds).hash(PASSWORD)
+    assert benchmark.pedantic(
+        Hasher.verify_password, args=(PASSWORD, hashed_password), rounds=5
+    )
+
+
+@pytest.mark.parametrize("rounds", BCRYPT_ROUNDS)
+def test_get_password_hash(benchmark, monkeypatch, rounds):
+    monkeypatch.setattr(hashing, "pwd_context", hashing.make_pwd_context(rounds))
+    benchmark.pedantic(Hasher.get_password_hash, args=(PASSWORD,), rounds=5)
+
+
+def test_create_access_token(benchmark):
+    benchmark(create_access_token, {"sub": "alisherertaev@gmail.com"})
+
+
+def test_jwt_decode(benchmark):
+    token = create_access_token({"sub": "alisherertaev@gmail.com"})
+    claims = benchmark(
+        jwt.decode,
+        token,
+        key_set.verification_key(token),
+        algorithms=[key_set.algorithm],
+    )
+    assert claims["sub"] == "alisherertaev@gmail.com"
+
+
+def test_decode_access_token_cached(benchmark):
+    token = create_access_token({"sub": "alisherertaev@gmail.com"})
+    decode_access_token(token)
+    assert benchmark(decode_access_token, token)["sub"] == "alisherertaev@gmail.com"
+
+
+def test_revocation_check(benchmark):
+    revocation_list = RevocationList(
+        sync_interval=5, rebuild_interval=600, capacity=100000, error_rate=0.01
+    )
+    revocation_list.rebuild(uuid.uuid4().hex for _ in range(100000))
+    jti = uuid.uuid4().hex
+    assert not benchmark(revocation_list.is_revoked, jti)
+
+
+def test_user_create_validation(benchmark):
+    payload = {
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "password": PASSWORD,
+    }
+    benchmark(UserCreate.parse_obj, payload)
+
+
+def test_update_user_request_validation(benchmark):
+    payload = {"name": "Alisher", "surname": "Yertayev"}
+    benchmark(UpdateUserRequest.parse_obj, payload)
+
+
+def test_show_user_serialization(benchmark, user_record):
+    def serialize():
+        return SchemaResponse(ShowUser.from_orm(user_record)).body
+
+    assert benchmark(serialize).startswith(b"{")
+
+
+@pytest.mark.parametrize(
+    "target_role_mask",
+    [PortalRole.ROLE_PORTAL_USER.bit, PortalRole.ROLE_PORTAL_ADMIN.bit | 1],
+    ids=["user_target", "admin_target"],
+)
+def test_check_user_permissions(benchmark, target_role_mask):
+    current_user = Principal(
+        uuid.uuid4(),
+        "admin@example.com",
+        PortalRole.ROLE_PORTAL_ADMIN.bit | PortalRole.ROLE_PORTAL_USER.bit,
+        True,
+    )
+    target_user = TargetRow(uuid.uuid4(), target_role_mask)
+    benchmark(
+        check_user_permissions, target_user=target_user, current_user=current_user
+    )
@@ -0,0 +1,111 @@
+import time
+from collections import OrderedDict
+from typing import Any
+from typing import Hashable
+from typing import Optional
+
+import settings
+from metrics import CACHE_EVICTIONS
+from metrics import CACHE_HITS
+from metrics import CACHE_MISSES
+
+
+class LRUTTLCache:
+    """Bounded LRU cache whose entries also expire after ``ttl`` seconds.
+
+    It is meant to be used from the event loop only, so there is no locking.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple[Any, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None):
+        item = self._data.get(key)
+        if item is not None and item[1] <= time.monotonic():
+            self._remove(key, "expired")
+            item = None
+        if item is None:
+            self.misses += 1
+            CACHE_MISSES.labels(self.name).inc()
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        CACHE_HITS.labels(self.name).inc()
+        return item[0]
+
+    def set(self, key: Hashable, value, ttl: Optional[float] = None):
+        """Store ``value``, ``ttl`` can only shorten the cache wide ttl"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._on_set(key, value)
+        while len(self._data) > self.maxsize:
+            self._remove(next(iter(self._data)), "size")
+
+    def pop(self, key: Hashable):
+        if key in self._data:
+            self._remove(key)
+
+    def clear(self):
+        for key in list(self._data):
+            self._remove(key)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: Hashable, eviction_reason: Optional[str] = None):
+        value, _ = self._data.pop(key)
+        self._on_remove(key, value)
+        if eviction_reason is not None:
+            self.evictions += 1
+            CACHE_EVICTIONS.labels(self.name, eviction_reason).inc()
+
+    def _on_set(self, key: Hashable, value):
+        pass
+
+    def _on_remove(self, key: Hashable, value):
+        pass
+
+
+class PrincipalCache(LRUTTLCache):
+    """Authenticated users keyed by token subject, invalidated by user id"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__("principal", maxsize=maxsize, ttl=ttl)
+        self._subjects_by_user_id: dict = {}
+
+    def invalidate_user(self, user_id):
+        subject = self._subjects_by_user_id.get(user_id)
+        if subject is not None:
+            self.pop(subject)
+
+    def _on_set(self, key: Hashable, value):
+        self._subjects_by_user_id[value.user_id] = key
+
+    def _on_remove(self, key: Hashable, value):
+        if self._subjects_by_user_id.get(value.user_id) == key:
+            del self._subjects_by_user_id[value.user_id]
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
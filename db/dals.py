@@ -1,15 +1,124 @@
+import functools
+import uuid
+from datetime import datetime
+from typing import AsyncIterator
+from typing import Optional
 from typing import Union
 
-from sqlalchemy import and_
+from sqlalchemy import bindparam
+from sqlalchemy import delete
+from sqlalchemy import event
+from sqlalchemy import func
 from sqlalchemy import select
+from sqlalchemy import true
 from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ColumnElement
+from sqlalchemy.sql import Select
 
+import settings
+from cache import principal_cache
+from db.instrumentation import instrumented_dal
+from db.models import has_role
 from db.models import PortalRole
+from db.models import RevokedToken
+from db.models import roles_to_mask
 from db.models import User
+from db.records import AuthRecord
+from db.records import UserRecord
 
+# Hot statements are built once, per-call values travel as bound parameters.
+# A prebuilt statement memoizes its cache key, so a call skips construction
+# and cache key generation and goes straight to the compiled cache; its SQL
+# text never changes, so asyncpg reuses the prepared statement too.
+# Parameter names differ from column names, as UPDATE reserves those for SET.
+_SELECT_USER_BY_ID = select(User).where(User.user_id == bindparam("target_user_id"))
+_AUTH_RECORD_COLUMNS = [getattr(User, name) for name in AuthRecord._fields]
+_SELECT_AUTH_RECORD_BY_EMAIL = select(*_AUTH_RECORD_COLUMNS).where(
+    func.lower(User.email) == bindparam("email_lower")
+)
+_SELECT_AUTH_RECORD_BY_ID = select(*_AUTH_RECORD_COLUMNS).where(
+    User.user_id == bindparam("target_user_id")
+)
+# changing any of these outdates the claims of self-contained tokens
+TOKEN_CLAIM_COLUMNS = frozenset(["email", "role_mask", "is_active"])
 
+
+def _invalidate_user_on_commit(db_session: AsyncSession, user_id: UUID):
+    """Drop the cached principal of ``user_id`` once the transaction commits.
+
+    Dropping it earlier would let a request in between cache the row as it
+    was before the change, for the whole ttl.
+    """
+    db_session.info.setdefault("invalidated_user_ids", set()).add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session):
+    for user_id in session.info.pop("invalidated_user_ids", ()):
+        principal_cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session: Session):
+    session.info.pop("invalidated_user_ids", None)
+
+
+@functools.lru_cache(maxsize=None)
+def _list_users_query(
+    after_user_id: bool, is_active: bool, role: Optional[PortalRole]
+) -> Select:
+    """One prebuilt statement per combination of filters, the filter values
+    themselves are bound parameters"""
+    query = select(User).order_by(User.user_id).limit(bindparam("limit"))
+    if after_user_id:
+        query = query.where(User.user_id > bindparam("after_user_id"))
+    if is_active:
+        query = query.where(User.is_active == bindparam("is_active"))
+    if role is not None:
+        # the role is inlined so the planner can match the partial index
+        query = query.where(has_role(role))
+    return query
+
+
+# the same reads in Core, against the table rather than the mapped class
+users_table = User.__table__
+_CORE_USER_COLUMNS = [users_table.c[name] for name in UserRecord._fields]
+_CORE_SELECT_USER_BY_ID = select(*_CORE_USER_COLUMNS).where(
+    users_table.c.user_id == bindparam("target_user_id")
+)
+_CORE_AUTH_RECORD_COLUMNS = [users_table.c[name] for name in AuthRecord._fields]
+_CORE_SELECT_AUTH_RECORD_BY_EMAIL = select(*_CORE_AUTH_RECORD_COLUMNS).where(
+    func.lower(users_table.c.email) == bindparam("email_lower")
+)
+_CORE_SELECT_AUTH_RECORD_BY_ID = select(*_CORE_AUTH_RECORD_COLUMNS).where(
+    users_table.c.user_id == bindparam("target_user_id")
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _core_list_users_query(
+    after_user_id: bool, is_active: bool, role: Optional[PortalRole]
+) -> Select:
+    query = (
+        select(*_CORE_USER_COLUMNS)
+        .order_by(users_table.c.user_id)
+        .limit(bindparam("limit"))
+    )
+    if after_user_id:
+        query = query.where(users_table.c.user_id > bindparam("after_user_id"))
+    if is_active:
+        query = query.where(users_table.c.is_active == bindparam("is_active"))
+    if role is not None:
+        query = query.where(has_role(role, users_table.c.role_mask))
+    return query
+
+
+@instrumented_dal
 class UserDAL:
     """Data Access Layer for operating user info"""
 
@@ -30,39 +139,159 @@ class UserDAL:
             surname=surname,
             email=email,
             hashed_password=hashed_password,
-            roles=roles,
+            role_mask=roles_to_mask(roles),
         )
         self.db_session.add(new_user)
         await self.db_session.flush()
         return new_user
 
-    async def delete_user(self, user_id: UUID) -> Union[UUID, None]:
-        query = (
-            update(User)
-            .where(and_(User.user_id == user_id, User.is_active == True))
-            .values(is_active=False)
-            .returning(User.user_id)
+    async def get_existing_emails(self, emails: list[str]) -> set[str]:
+        """Return the lower-cased emails among ``emails`` that are taken"""
+        lower_email = func.lower(User.email)
+        query = select(lower_email).where(
+            lower_email.in_([email.lower() for email in emails])
         )
         res = await self.db_session.execute(query)
-        deleted_user_id_row = res.fetchone()
-        if deleted_user_id_row is not None:
-            return deleted_user_id_row[0]
+        return set(res.scalars())
+
+    async def bulk_create_users(self, users: list[dict]) -> dict[str, UUID]:
+        """Insert users with one multi-row statement per chunk.
+
+        Rows whose email is already taken in any letter case are skipped,
+        returns the ids of the inserted users by email.
+        """
+        created = {}
+        chunk_size = settings.USER_BATCH_INSERT_CHUNK_SIZE
+        for i in range(0, len(users), chunk_size):
+            rows = [
+                {"user_id": uuid.uuid4(), "is_active": True, **user}
+                for user in users[i : i + chunk_size]
+            ]
+            query = (
+                insert(User)
+                .values(rows)
+                .on_conflict_do_nothing()
+                .returning(User.user_id, User.email)
+            )
+            res = await self.db_session.execute(query)
+            created.update((email, user_id) for user_id, email in res.fetchall())
+        return created
 
     async def get_user_by_id(self, user_id: UUID) -> Union[User, None]:
-        query = select(User).where(User.user_id == user_id)
-        res = await self.db_session.execute(query)
+        res = await self.db_session.execute(
+            _SELECT_USER_BY_ID, {"target_user_id": user_id}
+        )
         user_row = res.fetchone()
         if user_row is not None:
             return user_row[0]
 
-    async def get_user_by_email(self, email: str) -> Union[User, None]:
-        query = select(User).where(User.email == email)
-        res = await self.db_session.execute(query)
+    async def get_auth_record_by_email(self, email: str) -> Union[AuthRecord, None]:
+        """Fetch only what authentication needs, every selected column is
+        included in ``ix_users_email_lower`` so this is an index-only scan"""
+        res = await self.db_session.execute(
+            _SELECT_AUTH_RECORD_BY_EMAIL, {"email_lower": email.lower()}
+        )
         user_row = res.fetchone()
         if user_row is not None:
-            return user_row[0]
+            return AuthRecord(*user_row)
+
+    async def get_auth_record_by_id(self, user_id: UUID) -> Union[AuthRecord, None]:
+        res = await self.db_session.execute(
+            _SELECT_AUTH_RECORD_BY_ID, {"target_user_id": user_id}
+        )
+        user_row = res.fetchone()
+        if user_row is not None:
+            return AuthRecord(*user_row)
+
+    async def update_user_if(
+        self, user_id: UUID, condition: ColumnElement, **kwargs
+    ) -> Union[Row, None]:
+        """Update an active user only if ``condition`` holds, in one statement.
+
+        Returns None if there is no such user, otherwise the row as it was
+        before the update (``user_id``, ``role_mask``, ``is_active``) together
+        with ``updated_user_id``, which is None if nothing was updated.
+        """
+        if TOKEN_CLAIM_COLUMNS.intersection(kwargs):
+            kwargs["token_version"] = User.token_version + 1
+        target = (
+            select(User.user_id, User.role_mask, User.is_active)
+            .where(User.user_id == user_id)
+            .cte("target")
+        )
+        updated = (
+            update(User)
+            .where(User.user_id == user_id, User.is_active == True, condition)
+            .values(kwargs)
+            .returning(User.user_id)
+            .cte("updated")
+        )
+        query = select(
+            target.c.user_id,
+            target.c.role_mask,
+            target.c.is_active,
+            updated.c.user_id.label("updated_user_id"),
+        ).select_from(target.outerjoin(updated, true()))
+        res = await self.db_session.execute(query)
+        user_row = res.fetchone()
+        if user_row is not None and user_row.updated_user_id is not None:
+            _invalidate_user_on_commit(self.db_session, user_row.updated_user_id)
+        return user_row
+
+    async def list_users(
+        self,
+        limit: int,
+        after_user_id: Optional[UUID] = None,
+        is_active: Optional[bool] = None,
+        role: Optional[PortalRole] = None,
+    ) -> list[User]:
+        """Page through users ordered by the primary key.
+
+        Seeking past ``after_user_id`` instead of using OFFSET keeps every
+        page an index range scan, however deep the page is.
+        """
+        query = _list_users_query(
+            after_user_id is not None, is_active is not None, role
+        )
+        res = await self.db_session.execute(
+            query,
+            {"limit": limit, "after_user_id": after_user_id, "is_active": is_active},
+        )
+        return list(res.scalars())
+
+    async def list_users_by_role(
+        self, role: PortalRole, limit: int, after_user_id: Optional[UUID] = None
+    ) -> list[User]:
+        """Page through users having ``role``, served by the partial index
+        of the role for admins and superadmins"""
+        query = _list_users_query(after_user_id is not None, False, role)
+        res = await self.db_session.execute(
+            query, {"limit": limit, "after_user_id": after_user_id}
+        )
+        return list(res.scalars())
+
+    async def stream_users(self, batch_size: int) -> AsyncIterator[list]:
+        """Yield users in batches through a server-side cursor, must be
+        called inside a transaction"""
+        query = (
+            select(
+                User.user_id,
+                User.name,
+                User.surname,
+                User.email,
+                User.is_active,
+                User.role_mask,
+            )
+            .order_by(User.user_id)
+            .execution_options(yield_per=batch_size)
+        )
+        res = await self.db_session.stream(query)
+        async for rows in res.partitions():
+            yield rows
 
     async def update_user(self, user_id: UUID, **kwargs) -> Union[UUID, None]:
+        if TOKEN_CLAIM_COLUMNS.intersection(kwargs):
+            kwargs["token_version"] = User.token_version + 1
         query = (
             update(User)
             .where(User.user_id == user_id, User.is_active == True)
@@ -72,4 +301,116 @@ class UserDAL:
         res = await self.db_session.execute(query)
         update_user_id_row = res.fetchone()
         if update_user_id_row is not None:
+            _invalidate_user_on_commit(self.db_session, update_user_id_row[0])
             return update_user_id_row[0]
+
+
+@instrumented_dal
+class UserCoreDAL(UserDAL):
+    """UserDAL whose reads bypass the ORM.
+
+    Rows come back as immutable ``UserRecord`` tuples, without identity map
+    bookkeeping or instrumented attributes. Writes are inherited unchanged.
+    """
+
+    async def _fetch(self, query: Select, params: dict) -> list:
+        # the session's connection, so reads stay in its transaction
+        connection = await self.db_session.connection()
+        res = await connection.execute(query, params)
+        return res.fetchall()
+
+    async def get_user_by_id(self, user_id: UUID) -> Union[UserRecord, None]:
+        rows = await self._fetch(_CORE_SELECT_USER_BY_ID, {"target_user_id": user_id})
+        if rows:
+            return UserRecord._make(rows[0])
+
+    async def get_auth_record_by_email(self, email: str) -> Union[AuthRecord, None]:
+        rows = await self._fetch(
+            _CORE_SELECT_AUTH_RECORD_BY_EMAIL, {"email_lower": email.lower()}
+        )
+        if rows:
+            return AuthRecord._make(rows[0])
+
+    async def get_auth_record_by_id(self, user_id: UUID) -> Union[AuthRecord, None]:
+        rows = await self._fetch(
+            _CORE_SELECT_AUTH_RECORD_BY_ID, {"target_user_id": user_id}
+        )
+        if rows:
+            return AuthRecord._make(rows[0])
+
+    async def list_users(
+        self,
+        limit: int,
+        after_user_id: Optional[UUID] = None,
+        is_active: Optional[bool] = None,
+        role: Optional[PortalRole] = None,
+    ) -> list[UserRecord]:
+        query = _core_list_users_query(
+            after_user_id is not None, is_active is not None, role
+        )
+        rows = await self._fetch(
+            query,
+            {"limit": limit, "after_user_id": after_user_id, "is_active": is_active},
+        )
+        return [UserRecord._make(row) for row in rows]
+
+    async def list_users_by_role(
+        self, role: PortalRole, limit: int, after_user_id: Optional[UUID] = None
+    ) -> list[UserRecord]:
+        query = _core_list_users_query(after_user_id is not None, False, role)
+        rows = await self._fetch(
+            query, {"limit": limit, "after_user_id": after_user_id}
+        )
+        return [UserRecord._make(row) for row in rows]
+
+
+@instrumented_dal
+class RevokedTokenDAL:
+    """Data Access Layer for revoked token ids"""
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    async def revoke(self, jti: UUID, expires_at: datetime) -> bool:
+        """Store the id, False if it was revoked already"""
+        query = (
+            insert(RevokedToken)
+            .values(jti=jti, expires_at=expires_at)
+            .on_conflict_do_nothing(index_elements=[RevokedToken.jti])
+            .returning(RevokedToken.jti)
+        )
+        res = await self.db_session.execute(query)
+        return res.fetchone() is not None
+
+    async def list_revoked(self, revoked_since: Optional[datetime] = None) -> list:
+        """Ids and revocation times of the tokens that haven't expired yet"""
+        query = select(RevokedToken.jti, RevokedToken.revoked_at).where(
+            RevokedToken.expires_at > func.now()
+        )
+        if revoked_since is not None:
+            query = query.where(RevokedToken.revoked_at >= revoked_since)
+        res = await self.db_session.execute(query)
+        return res.fetchall()
+
+    async def delete_expired(self) -> int:
+        # now() can't be evaluated against the identity map
+        query = (
+            delete(RevokedToken)
+            .where(RevokedToken.expires_at <= func.now())
+            .execution_options(synchronize_session=False)
+        )
+        res = await self.db_session.execute(query)
+        return res.rowcount
+
+
+USER_DAL_BACKENDS = {"orm": UserDAL, "core": UserCoreDAL}
+if settings.USER_DAL_BACKEND not in USER_DAL_BACKENDS:
+    raise ValueError(
+        f"USER_DAL_BACKEND must be one of {sorted(USER_DAL_BACKENDS)}, "
+        f"got {settings.USER_DAL_BACKEND!r}"
+    )
+
+
+def get_user_dal(db_session: AsyncSession) -> UserDAL:
+    """UserDAL of the backend picked by ``settings.USER_DAL_BACKEND``"""
+    return USER_DAL_BACKENDS[settings.USER_DAL_BACKEND](db_session)
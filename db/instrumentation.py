@@ -0,0 +1,78 @@
+import functools
+import inspect
+import time
+from contextvars import ContextVar
+
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from metrics import DAL_CALL_DURATION
+from metrics import DAL_ERRORS
+from metrics import DAL_ROWS
+from metrics import DB_STATEMENT_DURATION
+
+# labels are route templates and DAL method names, never raw paths or ids
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="none")
+current_dal_method: ContextVar[str] = ContextVar("current_dal_method", default="none")
+
+
+async def bind_endpoint_label(request: Request):
+    """Router dependency remembering which route the DB work belongs to"""
+    route = request.scope.get("route")
+    current_endpoint.set(f"{request.method} {getattr(route, 'path', 'unknown')}")
+
+
+def _count_rows(result) -> int:
+    """Rows a DAL method returned; records and ``Row`` objects are tuples
+    with ``_fields`` but a single row each"""
+    if result is None:
+        return 0
+    if isinstance(result, (list, set, dict)):
+        return len(result)
+    return 1
+
+
+def instrument_dal_method(method, label: str):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        token = current_dal_method.set(label)
+        endpoint = current_endpoint.get()
+        started_at = time.perf_counter()
+        try:
+            result = await method(*args, **kwargs)
+        except Exception:
+            DAL_ERRORS.labels(label, endpoint).inc()
+            raise
+        finally:
+            DAL_CALL_DURATION.labels(label, endpoint).observe(
+                time.perf_counter() - started_at
+            )
+            current_dal_method.reset(token)
+        DAL_ROWS.labels(label, endpoint).observe(_count_rows(result))
+        return result
+
+    return wrapper
+
+
+def instrumented_dal(cls):
+    """Class decorator timing every public coroutine method of a DAL"""
+    for name, method in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.iscoroutinefunction(method):
+            setattr(cls, name, instrument_dal_method(method, f"{cls.__name__}.{name}"))
+    return cls
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.statement_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    DB_STATEMENT_DURATION.labels(
+        current_dal_method.get(), current_endpoint.get()
+    ).observe(time.perf_counter() - context.statement_started_at)
+
+
+def instrument_engine(engine: AsyncEngine):
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
@@ -1,24 +1,98 @@
 import uuid
 from enum import Enum
+from typing import Iterable
 
 from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import func
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import literal_column
 from sqlalchemy import String
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.sql import ColumnElement
+from sqlalchemy.sql.operators import custom_op
 
 Base = declarative_base()
 
+# custom_op hashes by identity, with a fresh ``column.op("&")`` per call no
+# two statements share a cache key and every one of them is compiled again
+BIT_AND = custom_op("&")
+BIT_OR = custom_op("|")
+
 
 class PortalRole(str, Enum):
     ROLE_PORTAL_USER = "ROLE_PORTAL_USER"
     ROLE_PORTAL_ADMIN = "ROLE_PORTAL_ADMIN"
     ROLE_PORTAL_SUPERADMIN = "ROLE_PORTAL_SUPERADMIN"
 
+    @property
+    def bit(self) -> int:
+        return ROLE_BITS[self]
+
+
+# roles are stored as a bitmask, never renumber an existing role
+ROLE_BITS = {
+    PortalRole.ROLE_PORTAL_USER: 1 << 0,
+    PortalRole.ROLE_PORTAL_ADMIN: 1 << 1,
+    PortalRole.ROLE_PORTAL_SUPERADMIN: 1 << 2,
+}
+ALL_ROLES_MASK = sum(ROLE_BITS.values())
+# roles of every possible mask, so decoding a mask is a tuple lookup
+_ROLES_BY_MASK = tuple(
+    frozenset(role for role, bit in ROLE_BITS.items() if mask & bit)
+    for mask in range(ALL_ROLES_MASK + 1)
+)
+
+
+def roles_to_mask(roles: Iterable[str]) -> int:
+    mask = 0
+    for role in roles:
+        mask |= PortalRole(role).bit
+    return mask
+
+
+def mask_to_roles(mask: int) -> frozenset[PortalRole]:
+    return _ROLES_BY_MASK[mask & ALL_ROLES_MASK]
+
+
+# roles looked up by role often enough to get a partial index
+INDEXED_ROLES = (PortalRole.ROLE_PORTAL_ADMIN, PortalRole.ROLE_PORTAL_SUPERADMIN)
+
+
+def _role_index_name(role: PortalRole) -> str:
+    return f"ix_users_{role.value.lower()}"
+
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # covers the auth lookup, so login is answered by an index-only scan
+        Index(
+            "ix_users_email_lower",
+            func.lower(text("email")),
+            unique=True,
+            postgresql_include=[
+                "email",
+                "user_id",
+                "hashed_password",
+                "role_mask",
+                "is_active",
+                "token_version",
+            ],
+        ),
+        *(
+            Index(
+                _role_index_name(role),
+                "user_id",
+                postgresql_where=text(f"(role_mask & {role.bit}) <> 0"),
+            )
+            for role in INDEXED_ROLES
+        ),
+    )
 
     user_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
@@ -26,20 +100,57 @@ class User(Base):
     email = Column(String, nullable=False, unique=True)
     is_active = Column(Boolean(), default=True)
     hashed_password = Column(String, nullable=False)
-    roles = Column(ARRAY(String), nullable=False)
+    role_mask = Column(
+        Integer,
+        nullable=False,
+        default=PortalRole.ROLE_PORTAL_USER.bit,
+        server_default=str(PortalRole.ROLE_PORTAL_USER.bit),
+    )
+    # bumped whenever a claim carried by self-contained tokens changes, so
+    # refresh tokens issued before that stop working
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    @property
+    def roles(self) -> frozenset[PortalRole]:
+        return mask_to_roles(self.role_mask)
 
     @property
     def is_superadmin(self) -> bool:
-        return PortalRole.ROLE_PORTAL_SUPERADMIN in self.roles
+        return bool(self.role_mask & PortalRole.ROLE_PORTAL_SUPERADMIN.bit)
 
     @property
     def is_admin(self) -> bool:
-        return PortalRole.ROLE_PORTAL_ADMIN in self.roles
+        return bool(self.role_mask & PortalRole.ROLE_PORTAL_ADMIN.bit)
 
     def enrich_admin_roles_by_admin_role(self):
         if not self.is_admin:
-            return {*self.roles, PortalRole.ROLE_PORTAL_ADMIN}
+            return self.role_mask | PortalRole.ROLE_PORTAL_ADMIN.bit
 
     def remove_admin_privileges_from_model(self):
         if self.is_admin:
-            return {role for role in self.roles if role != PortalRole.ROLE_PORTAL_ADMIN}
+            return self.role_mask & ~PortalRole.ROLE_PORTAL_ADMIN.bit
+
+
+def has_role(role: PortalRole, role_mask: ColumnElement = None) -> ColumnElement:
+    """``role_mask & bit <> 0`` with the bit inlined rather than bound, so
+    the planner can match it against the partial role indexes.
+
+    ``role_mask`` defaults to the ORM attribute, Core queries pass the
+    table column.
+    """
+    if role_mask is None:
+        role_mask = User.role_mask
+    return BIT_AND(role_mask, literal_column(str(role.bit))) != literal_column("0")
+
+
+class RevokedToken(Base):
+    """Id of a token revoked before it expired, kept until it would have"""
+
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(UUID(as_uuid=True), primary_key=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    # workers fetch the rows revoked since their last sync
+    revoked_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), index=True
+    )
@@ -0,0 +1,50 @@
+"""Lightweight read-only rows returned by the DAL where an ORM object
+would be wasted"""
+from typing import NamedTuple
+from uuid import UUID
+
+from db.models import mask_to_roles
+from db.models import PortalRole
+
+
+class AuthRecord(NamedTuple):
+    user_id: UUID
+    email: str
+    hashed_password: str
+    role_mask: int
+    is_active: bool
+    token_version: int
+
+    @property
+    def roles(self) -> frozenset[PortalRole]:
+        return mask_to_roles(self.role_mask)
+
+    @property
+    def is_superadmin(self) -> bool:
+        return bool(self.role_mask & PortalRole.ROLE_PORTAL_SUPERADMIN.bit)
+
+    @property
+    def is_admin(self) -> bool:
+        return bool(self.role_mask & PortalRole.ROLE_PORTAL_ADMIN.bit)
+
+
+class UserRecord(NamedTuple):
+    user_id: UUID
+    name: str
+    surname: str
+    email: str
+    is_active: bool
+    hashed_password: str
+    role_mask: int
+
+    @property
+    def roles(self) -> frozenset[PortalRole]:
+        return mask_to_roles(self.role_mask)
+
+    @property
+    def is_superadmin(self) -> bool:
+        return bool(self.role_mask & PortalRole.ROLE_PORTAL_SUPERADMIN.bit)
+
+    @property
+    def is_admin(self) -> bool:
+        return bool(self.role_mask & PortalRole.ROLE_PORTAL_ADMIN.bit)
@@ -1,21 +1,174 @@
+import asyncio
+import itertools
+import time
+from logging import getLogger
 from typing import Generator
+from typing import Optional
 
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
- 
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
 import settings
+from db.instrumentation import instrument_engine
+from metrics import DB_POOL_CHECKED_OUT
+from metrics import DB_POOL_CHECKOUT_WAIT
+from metrics import DB_POOL_IDLE
+from metrics import DB_POOL_OVERFLOW
+from metrics import DB_POOL_WAITERS
 
-# create async engine for interaction with database
-engine = create_async_engine(
-    settings.REAL_DATABASE_URL, 
-    future=True, 
-    echo=True,
+logger = getLogger(__name__)
+
+# zero while the replica has replayed everything it received, so an idle
+# primary doesn't make the replica look lagging
+REPLICATION_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE COALESCE("
+    "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Queue pool that tracks how many checkouts wait and for how long"""
+
+    engine_label = "primary"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiters = 0
+
+    def connect(self):
+        self.waiters += 1
+        started_at = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            self.waiters -= 1
+            DB_POOL_CHECKOUT_WAIT.labels(self.engine_label).observe(
+                time.perf_counter() - started_at
+            )
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.engine_label = self.engine_label
+        return pool
+
+
+def create_engine(database_url: str) -> AsyncEngine:
+    return create_async_engine(
+        database_url,
+        future=True,
+        echo=settings.DB_ECHO,
+        poolclass=InstrumentedAsyncPool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        query_cache_size=settings.DB_QUERY_CACHE_SIZE,
+        connect_args={
+            "prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE
+        },
     )
 
+
+def instrument_pool(engine: AsyncEngine, label: str):
+    """Export the pool gauges of ``engine`` under the given label"""
+    engine.sync_engine.pool.engine_label = label
+
+    def pool():
+        # looked up on every scrape because engine.dispose() replaces the pool
+        return engine.sync_engine.pool
+
+    DB_POOL_CHECKED_OUT.labels(label).set_function(lambda: pool().checkedout())
+    DB_POOL_IDLE.labels(label).set_function(lambda: pool().checkedin())
+    DB_POOL_OVERFLOW.labels(label).set_function(lambda: max(pool().overflow(), 0))
+    DB_POOL_WAITERS.labels(label).set_function(lambda: pool().waiters)
+
+
+class ReplicaSet:
+    """Round-robin over the read replicas that passed the last health check"""
+
+    def __init__(self, engines: list, check_interval: float, max_lag: float):
+        self.engines = engines
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        # every replica is trusted until the first check says otherwise
+        self._healthy = list(engines)
+        self._counter = itertools.count()
+        self._task = None
+
+    def pick(self) -> Optional[AsyncEngine]:
+        healthy = self._healthy
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    async def _replication_lag(self, engine: AsyncEngine) -> float:
+        async with engine.connect() as connection:
+            return await connection.scalar(REPLICATION_LAG_QUERY)
+
+    async def _is_healthy(self, engine: AsyncEngine) -> bool:
+        # connecting is bounded too, an unreachable host may never answer
+        try:
+            lag = await asyncio.wait_for(
+                self._replication_lag(engine), self.check_interval
+            )
+        except (SQLAlchemyError, OSError, asyncio.TimeoutError) as err:
+            logger.warning("replica %r is unavailable: %s", engine.url, err)
+            return False
+        if lag > self.max_lag:
+            logger.warning("replica %r lags %.1fs behind", engine.url, lag)
+            return False
+        return True
+
+    async def check(self):
+        results = await asyncio.gather(
+            *(self._is_healthy(engine) for engine in self.engines)
+        )
+        self._healthy = [
+            engine for engine, healthy in zip(self.engines, results) if healthy
+        ]
+
+    async def _check_forever(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    async def start(self):
+        if self.engines and self._task is None:
+            await self.check()
+            self._task = asyncio.create_task(self._check_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# create async engine for interaction with database
+engine = create_engine(settings.REAL_DATABASE_URL)
+instrument_pool(engine, "primary")
+instrument_engine(engine)
+
+replica_engines = [create_engine(url) for url in settings.REPLICA_DATABASE_URLS]
+for number, replica_engine in enumerate(replica_engines):
+    instrument_pool(replica_engine, f"replica{number}")
+    instrument_engine(replica_engine)
+replicas = ReplicaSet(
+    replica_engines,
+    check_interval=settings.REPLICA_HEALTH_CHECK_INTERVAL_SECONDS,
+    max_lag=settings.REPLICA_MAX_LAG_SECONDS,
+)
+
 # create session for the interaction with database
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+
 async def get_db() -> Generator:
     """Dependency for getting async session"""
     try:
@@ -24,3 +177,22 @@ async def get_db() -> Generator:
 
     finally:
         await session.close()
+
+
+async def get_read_db() -> Generator:
+    """Dependency for getting async session bound to a read replica
+
+    Falls back to the primary when no replica is configured or healthy. Only
+    for reads that tolerate replication lag, anything that has to see its own
+    writes uses ``get_db``.
+    """
+    replica = replicas.pick()
+    try:
+        if replica is None:
+            session: AsyncSession = async_session()
+        else:
+            session: AsyncSession = async_session(bind=replica)
+        yield session
+
+    finally:
+        await session.close()
@@ -1,6 +1,65 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+from typing import Optional
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import settings
+from metrics import HASHING_DURATION
+from metrics import HASHING_QUEUE_WAIT
+from metrics import HASHING_REJECTED
+
+logger = getLogger(__name__)
+
+# bcrypt can't go beyond 31 rounds, it's the ceiling of the calibration too
+BCRYPT_MAX_ROUNDS = 31
+
+
+def make_pwd_context(rounds: int) -> CryptContext:
+    """New hashes use ``rounds``, weaker existing ones are due for a rehash
+    and stronger ones are left alone"""
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=BCRYPT_MAX_ROUNDS,
+    )
+
+
+pwd_context = make_pwd_context(settings.BCRYPT_ROUNDS)
+
+
+def configure_rounds(rounds: int):
+    """Switch this process to ``rounds``, also the initializer of the
+    hashing worker processes"""
+    global pwd_context
+    pwd_context = make_pwd_context(rounds)
+
+
+def calibrate_rounds(target_seconds: float, min_rounds: int, samples: int = 3) -> int:
+    """Highest rounds whose verify still fits ``target_seconds`` on this
+    machine, never below ``min_rounds``.
+
+    Every extra round doubles the work, so one measurement at ``min_rounds``
+    is extrapolated instead of trying each cost.
+    """
+    context = make_pwd_context(min_rounds)
+    hashed_password = context.hash("calibration")
+    timings = []
+    for _ in range(samples):
+        started_at = time.perf_counter()
+        context.verify("calibration", hashed_password)
+        timings.append(time.perf_counter() - started_at)
+    duration = statistics.median(timings)
+    rounds = min_rounds
+    while rounds < BCRYPT_MAX_ROUNDS and duration * 2 <= target_seconds:
+        rounds += 1
+        duration *= 2
+    return rounds
 
 
 class Hasher:
@@ -8,6 +67,148 @@ class Hasher:
     def verify_password(plain_password, hashed_password):
         return pwd_context.verify(plain_password, hashed_password)
 
+    @staticmethod
+    def verify_and_update(
+        plain_password, hashed_password
+    ) -> tuple[bool, Optional[str]]:
+        """Verify the password and return a new hash as well if the old one
+        is weaker than the configured cost"""
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+
     @staticmethod
     def get_password_hash(password: str) -> str:
         return pwd_context.hash(password)
+
+
+class HashingQueueFull(Exception):
+    """Raised when there is no free slot left for another hashing job"""
+
+
+def _run_hashing_job(operation: str, args: tuple, submitted_at: float):
+    """Executed inside a worker process, returns the result and its timings"""
+    started_at = time.time()
+    if operation == "verify":
+        result = Hasher.verify_password(*args)
+    elif operation == "verify_and_update":
+        result = Hasher.verify_and_update(*args)
+    else:
+        result = Hasher.get_password_hash(*args)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+class AsyncHasher:
+    """Runs bcrypt in a process pool so it never blocks the event loop.
+
+    At most ``max_workers`` jobs are hashed at once and at most
+    ``max_queue_size`` more may wait for a worker, anything beyond that is
+    rejected with ``HashingQueueFull``.
+    """
+
+    def __init__(self, max_workers: int, max_queue_size: int, rounds: int):
+        self.max_workers = max_workers
+        self.max_pending = max_workers + max_queue_size
+        self.rounds = rounds
+        self._pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # workers get the rounds explicitly, a calibrated value exists
+            # only in this process
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=configure_rounds,
+                initargs=(self.rounds,),
+            )
+        return self._executor
+
+    def set_rounds(self, rounds: int):
+        """Use ``rounds`` here and in the workers, which are restarted"""
+        self.rounds = rounds
+        configure_rounds(rounds)
+        self.shutdown()
+
+    async def calibrate(self, target_seconds: float, min_rounds: int) -> int:
+        loop = asyncio.get_running_loop()
+        rounds = await loop.run_in_executor(
+            None, calibrate_rounds, target_seconds, min_rounds
+        )
+        logger.info(
+            "bcrypt calibrated to %s rounds for a %.0f ms verify",
+            rounds,
+            target_seconds * 1000,
+        )
+        self.set_rounds(rounds)
+        return rounds
+
+    def _reserve(self, operation: str):
+        if self._pending >= self.max_pending:
+            HASHING_REJECTED.labels(operation).inc()
+            raise HashingQueueFull("Password hashing queue is full")
+        self._pending += 1
+
+    def _release(self):
+        self._pending -= 1
+
+    async def _submit(self, operation: str, *args):
+        self._reserve(operation)
+        loop = asyncio.get_running_loop()
+        try:
+            job = self._get_executor().submit(
+                _run_hashing_job, operation, args, time.time()
+            )
+        except BaseException:
+            self._release()
+            raise
+        # the slot is given back once the worker is done with the job, not
+        # when the caller stops waiting, a cancelled job that already
+        # started keeps its worker busy until it finishes
+        job.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        result, queue_wait, duration = await asyncio.wrap_future(job)
+        HASHING_QUEUE_WAIT.labels(operation).observe(max(queue_wait, 0))
+        HASHING_DURATION.labels(operation).observe(duration)
+        return result
+
+    async def verify_password(self, plain_password, hashed_password) -> bool:
+        return await self._submit("verify", plain_password, hashed_password)
+
+    async def verify_and_update(
+        self, plain_password, hashed_password
+    ) -> tuple[bool, Optional[str]]:
+        return await self._submit("verify_and_update", plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str) -> str:
+        return await self._submit("hash", password)
+
+    async def get_password_hashes(self, passwords: list[str]) -> list[str]:
+        """Hash many passwords, each one a job of its own so it takes a slot
+        of the queue like any other hash and is timed on its own.
+
+        At most half of the workers hash for one batch at a time, logins
+        queue behind a single hash of it at worst.
+        """
+        in_flight = asyncio.Semaphore(max(self.max_workers // 2, 1))
+
+        async def hash_one(password: str) -> str:
+            async with in_flight:
+                return await self._submit("hash_many", password)
+
+        jobs = [asyncio.ensure_future(hash_one(password)) for password in passwords]
+        try:
+            return await asyncio.gather(*jobs)
+        finally:
+            # a rejected job fails the batch, the rest of it is not hashed
+            for job in jobs:
+                job.cancel()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+async_hasher = AsyncHasher(
+    max_workers=settings.HASHING_POOL_SIZE,
+    max_queue_size=settings.HASHING_QUEUE_SIZE,
+    rounds=settings.BCRYPT_ROUNDS,
+)
@@ -1,13 +1,21 @@
 import sentry_sdk
 import uvicorn
+from fastapi import Depends
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.routing import APIRouter
 from starlette_exporter import handle_metrics
 from starlette_exporter import PrometheusMiddleware
 
 import settings
 from api.handlers import user_router
+from api.jwks_handler import jwks_router
 from api.login_handler import login_router
+from db.instrumentation import bind_endpoint_label
+from db.session import replicas
+from hashing import async_hasher
+from revocation import revocation_list
+from throttling import login_throttle
 
 sentry_sdk.init(
     dsn=settings.SENTRY_URL,
@@ -17,16 +25,57 @@ sentry_sdk.init(
 )
 
 # create instance of the app
-app = FastAPI(title="FastAPI project")
+app = FastAPI(title="FastAPI project", default_response_class=ORJSONResponse)
 app.add_middleware(PrometheusMiddleware)
 app.add_route("/metrics", handle_metrics)
 
+
+@app.on_event("startup")
+async def calibrate_password_hashing():
+    if settings.BCRYPT_TARGET_VERIFY_MS > 0:
+        await async_hasher.calibrate(
+            settings.BCRYPT_TARGET_VERIFY_MS / 1000, min_rounds=settings.BCRYPT_ROUNDS
+        )
+
+
+@app.on_event("startup")
+async def start_replica_health_checks():
+    await replicas.start()
+
+
+@app.on_event("shutdown")
+async def stop_replica_health_checks():
+    await replicas.stop()
+
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    await revocation_list.start()
+
+
+@app.on_event("shutdown")
+async def stop_revocation_sync():
+    await revocation_list.stop()
+
+
+@app.on_event("shutdown")
+async def close_login_throttle():
+    if login_throttle is not None:
+        await login_throttle.store.close()
+
+
+@app.on_event("shutdown")
+def shutdown_hashing_pool():
+    async_hasher.shutdown()
+
+
 # create the instance for the routes
-main_api_router = APIRouter()
+main_api_router = APIRouter(dependencies=[Depends(bind_endpoint_label)])
 
 # set routes to the app instances
 main_api_router.include_router(user_router, prefix="/user", tags=["user"])
 main_api_router.include_router(login_router, prefix="/login", tags=["login"])
+main_api_router.include_router(jwks_router, tags=["jwks"])
 
 app.include_router(main_api_router)
 
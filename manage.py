@@ -0,0 +1,213 @@
+"""Management commands.
+
+    python manage.py import-users users.csv --on-conflict upsert
+    python manage.py export-users --format csv --gzip -o users.csv.gz
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+
+import asyncpg
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import settings
+from api.actions.export import _export_users
+from api.actions.export import gzip_chunks
+from db.models import PortalRole
+from db.models import User
+from db.session import create_engine
+from hashing import Hasher
+
+USER_COLUMNS = [column.name for column in User.__table__.columns]
+UPDATABLE_COLUMNS = ["name", "surname", "is_active", "hashed_password"]
+
+
+def _asyncpg_dsn(database_url: str) -> str:
+    return "".join(database_url.split("+asyncpg"))
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ("0", "false", "f", "no", "")
+
+
+def _read_users(path: str, file_format: str) -> Iterator[dict]:
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _chunked(iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _prepare_records(users: list[dict]) -> list[tuple]:
+    """Executed in a worker process, turns input rows into ``users`` records.
+
+    Rows that already carry a ``hashed_password`` are not hashed again.
+    """
+    records = []
+    for user in users:
+        values = {
+            "user_id": uuid.uuid4(),
+            "name": user["name"],
+            "surname": user["surname"],
+            "email": user["email"],
+            "is_active": _parse_bool(user.get("is_active", True)),
+            "hashed_password": user.get("hashed_password")
+            or Hasher.get_password_hash(user["password"]),
+            "role_mask": PortalRole.ROLE_PORTAL_USER.bit,
+            "token_version": 0,
+        }
+        records.append(tuple(values[column] for column in USER_COLUMNS))
+    return records
+
+
+async def _hash_chunk(executor, workers: int, users: list[dict]) -> list[tuple]:
+    loop = asyncio.get_running_loop()
+    part_size = -(-len(users) // workers)
+    parts = await asyncio.gather(
+        *(
+            loop.run_in_executor(executor, _prepare_records, users[i : i + part_size])
+            for i in range(0, len(users), part_size)
+        )
+    )
+    return [record for part in parts for record in part]
+
+
+async def _copy_chunk(connection, records: list[tuple], on_conflict: str) -> int:
+    columns = ", ".join(USER_COLUMNS)
+    if on_conflict == "upsert":
+        # emails are unique regardless of letter case
+        conflict_clause = "ON CONFLICT (lower(email)) DO UPDATE SET " + ", ".join(
+            [f"{column} = EXCLUDED.{column}" for column in UPDATABLE_COLUMNS]
+            # a changed is_active outdates the claims of issued tokens
+            + [
+                "token_version = users.token_version"
+                " + (users.is_active IS DISTINCT FROM EXCLUDED.is_active)::int"
+            ]
+        )
+    else:
+        conflict_clause = "ON CONFLICT DO NOTHING"
+    async with connection.transaction():
+        await connection.copy_records_to_table(
+            "users_import", records=records, columns=USER_COLUMNS
+        )
+        # DISTINCT ON keeps a single row per email, an upsert can't touch
+        # the same row twice within one statement
+        status = await connection.execute(
+            f"INSERT INTO users ({columns}) "
+            f"SELECT DISTINCT ON (lower(email)) {columns} FROM users_import "
+            f"ORDER BY lower(email) {conflict_clause}"
+        )
+        await connection.execute("TRUNCATE users_import")
+    return int(status.split()[-1])
+
+
+async def import_users(args: argparse.Namespace):
+    connection = await asyncpg.connect(_asyncpg_dsn(args.database_url))
+    await connection.execute(
+        "CREATE TEMP TABLE users_import (LIKE users INCLUDING DEFAULTS)"
+    )
+    read = written = 0
+    started_at = time.monotonic()
+    copying = None
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            # hashing of a chunk overlaps with the COPY of the previous one,
+            # so at most two chunks are held in memory
+            for users in _chunked(_read_users(args.path, args.format), args.chunk_size):
+                records = await _hash_chunk(executor, args.workers, users)
+                if copying is not None:
+                    written += await copying
+                copying = asyncio.create_task(
+                    _copy_chunk(connection, records, args.on_conflict)
+                )
+                read += len(users)
+                elapsed = time.monotonic() - started_at
+                print(
+                    f"read {read} rows, written {written}, {read / elapsed:.0f} rows/s",
+                    file=sys.stderr,
+                )
+            if copying is not None:
+                written += await copying
+                copying = None
+    finally:
+        if copying is not None:
+            copying.cancel()
+        await connection.close()
+    elapsed = time.monotonic() - started_at
+    print(
+        f"done: read {read} rows, written {written} "
+        f"({args.on_conflict} on conflict) in {elapsed:.1f}s",
+        file=sys.stderr,
+    )
+
+
+async def export_users(args: argparse.Namespace):
+    engine = create_engine(args.database_url)
+    session = AsyncSession(engine, expire_on_commit=False)
+    chunks = _export_users(args.format, session)
+    if args.gzip:
+        chunks = gzip_chunks(chunks)
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        async for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        await session.close()
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser(
+        "import-users", help="load users from a CSV or NDJSON file"
+    )
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "ndjson"])
+    import_parser.add_argument(
+        "--on-conflict", choices=["skip", "upsert"], default="skip"
+    )
+    import_parser.add_argument("--chunk-size", type=int, default=5000)
+    import_parser.add_argument(
+        "--workers", type=int, default=settings.HASHING_POOL_SIZE
+    )
+    import_parser.add_argument("--database-url", default=settings.REAL_DATABASE_URL)
+    import_parser.set_defaults(handler=import_users)
+
+    export_parser = subparsers.add_parser(
+        "export-users", help="dump all users as NDJSON or CSV"
+    )
+    export_parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    export_parser.add_argument("-o", "--output", default="-")
+    export_parser.add_argument("--gzip", action="store_true")
+    export_parser.add_argument("--database-url", default=settings.REAL_DATABASE_URL)
+    export_parser.set_defaults(handler=export_users)
+
+    args = parser.parse_args()
+    if args.command == "import-users" and args.format is None:
+        args.format = "ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv"
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Application level Prometheus metrics.
+
+Everything registered here lives in the default ``prometheus_client`` registry,
+so it is exported by the ``/metrics`` route of ``starlette_exporter``.
+"""
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+
+HASHING_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HASHING_QUEUE_WAIT = Histogram(
+    "password_hashing_queue_wait_seconds",
+    "Time a password hashing job waited for a free worker process",
+    ["operation"],
+    buckets=HASHING_BUCKETS,
+)
+HASHING_DURATION = Histogram(
+    "password_hashing_duration_seconds",
+    "Time spent by a worker process hashing or verifying a password",
+    ["operation"],
+    buckets=HASHING_BUCKETS,
+)
+HASHING_REJECTED = Counter(
+    "password_hashing_rejected_total",
+    "Password hashing jobs rejected because the queue was full",
+    ["operation"],
+)
+
+LOGIN_THROTTLE_DECISIONS = Counter(
+    "login_throttle_decisions_total",
+    "Login attempts let through or rejected by a throttle bucket",
+    ["bucket", "decision"],
+)
+
+# only lookups the Bloom filter let through are counted, the common miss
+# stays free of metric overhead
+REVOCATION_LOOKUPS = Counter(
+    "token_revocation_lookups_total",
+    "Token ids the revocation Bloom filter reported, by exact lookup result",
+    ["result"],
+)
+REVOKED_TOKENS = Gauge(
+    "revoked_tokens", "Unexpired revoked token ids held by this worker"
+)
+REVOCATION_SYNC_ERRORS = Counter(
+    "token_revocation_sync_errors_total",
+    "Failed syncs of the revoked token ids from the database",
+)
+
+CACHE_HITS = Counter("cache_hits_total", "In-process cache hits", ["cache"])
+CACHE_MISSES = Counter("cache_misses_total", "In-process cache misses", ["cache"])
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total",
+    "Entries dropped from an in-process cache",
+    ["cache", "reason"],
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out of the pool",
+    ["engine"],
+)
+DB_POOL_IDLE = Gauge(
+    "db_pool_idle_connections", "Connections idle in the pool", ["engine"]
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow_connections",
+    "Connections opened above pool_size",
+    ["engine"],
+)
+DB_POOL_WAITERS = Gauge(
+    "db_pool_waiters", "Checkouts waiting for a pooled connection", ["engine"]
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 30),
+)
+
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+DAL_CALL_DURATION = Histogram(
+    "dal_call_duration_seconds",
+    "Duration of data access layer calls",
+    ["dal_method", "endpoint"],
+    buckets=DB_BUCKETS,
+)
+DAL_ROWS = Histogram(
+    "dal_rows_returned",
+    "Rows returned or affected by data access layer calls",
+    ["dal_method", "endpoint"],
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000),
+)
+DAL_ERRORS = Counter(
+    "dal_errors_total",
+    "Data access layer calls that raised",
+    ["dal_method", "endpoint"],
+)
+DB_STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds",
+    "Duration of SQL statements executed on the engine",
+    ["dal_method", "endpoint"],
+    buckets=DB_BUCKETS,
+)
@@ -0,0 +1,41 @@
+"""add user credentials and roles
+
+Revision ID: 0f3a9c2d7e41
+Revises: 4b670c94bba9
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0f3a9c2d7e41'
+down_revision = '4b670c94bba9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # a database that already has both columns, made from an autogenerated
+    # revision, is stamped at this revision instead of upgraded through it
+    op.add_column(
+        'users',
+        sa.Column('hashed_password', sa.String(), nullable=False, server_default=''),
+    )
+    op.alter_column('users', 'hashed_password', server_default=None)
+    op.add_column(
+        'users',
+        sa.Column(
+            'roles',
+            postgresql.ARRAY(sa.String()),
+            nullable=False,
+            server_default='{ROLE_PORTAL_USER}',
+        ),
+    )
+    op.alter_column('users', 'roles', server_default=None)
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'roles')
+    op.drop_column('users', 'hashed_password')
@@ -0,0 +1,43 @@
+"""add revoked tokens
+
+Revision ID: 3d6f0b8e2a57
+Revises: e7b3d9a1c245
+Create Date: 2026-10-18 16:42:10.318274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '3d6f0b8e2a57'
+down_revision = 'e7b3d9a1c245'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'revoked_tokens',
+        sa.Column('jti', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column(
+            'revoked_at',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint('jti'),
+    )
+    op.create_index(
+        op.f('ix_revoked_tokens_expires_at'), 'revoked_tokens', ['expires_at']
+    )
+    op.create_index(
+        op.f('ix_revoked_tokens_revoked_at'), 'revoked_tokens', ['revoked_at']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_revoked_tokens_revoked_at'), table_name='revoked_tokens')
+    op.drop_index(op.f('ix_revoked_tokens_expires_at'), table_name='revoked_tokens')
+    op.drop_table('revoked_tokens')
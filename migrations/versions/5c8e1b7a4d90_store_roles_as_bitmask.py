@@ -0,0 +1,55 @@
+"""store roles as bitmask
+
+Revision ID: 5c8e1b7a4d90
+Revises: 0f3a9c2d7e41
+Create Date: 2026-10-18 10:48:05.915330
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '5c8e1b7a4d90'
+down_revision = '0f3a9c2d7e41'
+branch_labels = None
+depends_on = None
+
+# must match db.models.ROLE_BITS at the time of this revision
+ROLE_BITS = {
+    'ROLE_PORTAL_USER': 1,
+    'ROLE_PORTAL_ADMIN': 2,
+    'ROLE_PORTAL_SUPERADMIN': 4,
+}
+
+
+def upgrade() -> None:
+    op.add_column(
+        'users',
+        sa.Column('role_mask', sa.Integer(), nullable=False, server_default='1'),
+    )
+    backfill = " | ".join(
+        f"(CASE WHEN '{role}' = ANY(roles) THEN {bit} ELSE 0 END)"
+        for role, bit in ROLE_BITS.items()
+    )
+    op.execute(f"UPDATE users SET role_mask = {backfill}")
+    op.drop_column('users', 'roles')
+
+
+def downgrade() -> None:
+    op.add_column(
+        'users',
+        sa.Column(
+            'roles',
+            postgresql.ARRAY(sa.String()),
+            nullable=False,
+            server_default='{}',
+        ),
+    )
+    backfill = ", ".join(
+        f"CASE WHEN role_mask & {bit} <> 0 THEN '{role}' END"
+        for role, bit in ROLE_BITS.items()
+    )
+    op.execute(f"UPDATE users SET roles = array_remove(ARRAY[{backfill}], NULL)")
+    op.alter_column('users', 'roles', server_default=None)
+    op.drop_column('users', 'role_mask')
@@ -0,0 +1,40 @@
+"""add partial indexes on privileged roles
+
+Revision ID: 9a4f6d2b8c13
+Revises: 5c8e1b7a4d90
+Create Date: 2026-10-18 12:04:52.660183
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9a4f6d2b8c13'
+down_revision = '5c8e1b7a4d90'
+branch_labels = None
+depends_on = None
+
+# bits of db.models.ROLE_BITS, predicates must match db.models.has_role
+ROLE_INDEXES = {
+    'ix_users_role_portal_admin': 2,
+    'ix_users_role_portal_superadmin': 4,
+}
+
+
+def upgrade() -> None:
+    # built concurrently so that a large users table isn't locked for writes
+    with op.get_context().autocommit_block():
+        for index_name, bit in ROLE_INDEXES.items():
+            op.create_index(
+                index_name,
+                'users',
+                ['user_id'],
+                postgresql_where=sa.text(f'(role_mask & {bit}) <> 0'),
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for index_name in ROLE_INDEXES:
+            op.drop_index(index_name, 'users', postgresql_concurrently=True)
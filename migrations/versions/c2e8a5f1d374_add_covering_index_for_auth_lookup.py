@@ -0,0 +1,41 @@
+"""add covering index for auth lookup
+
+Revision ID: c2e8a5f1d374
+Revises: 9a4f6d2b8c13
+Create Date: 2026-10-18 12:41:17.208466
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c2e8a5f1d374'
+down_revision = '9a4f6d2b8c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # fails if emails differing only in letter case exist, they have to be
+    # merged by hand first. The raw email is included as well, otherwise the
+    # planner doesn't consider an index-only scan for the lower(email) key.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_email_lower',
+            'users',
+            [sa.text('lower(email)')],
+            unique=True,
+            postgresql_include=[
+                'email',
+                'user_id',
+                'hashed_password',
+                'role_mask',
+                'is_active',
+            ],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_email_lower', 'users', postgresql_concurrently=True)
@@ -0,0 +1,47 @@
+"""add user token version
+
+Revision ID: e7b3d9a1c245
+Revises: c2e8a5f1d374
+Create Date: 2026-10-18 15:07:52.481903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3d9a1c245'
+down_revision = 'c2e8a5f1d374'
+branch_labels = None
+depends_on = None
+
+AUTH_COLUMNS = ['email', 'user_id', 'hashed_password', 'role_mask', 'is_active']
+
+
+def _replace_auth_index(include: list) -> None:
+    # built under a temporary name first, so lower(email) stays unique and
+    # indexed the whole time
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_email_lower_new',
+            'users',
+            [sa.text('lower(email)')],
+            unique=True,
+            postgresql_include=include,
+            postgresql_concurrently=True,
+        )
+        op.drop_index('ix_users_email_lower', 'users', postgresql_concurrently=True)
+    op.execute('ALTER INDEX ix_users_email_lower_new RENAME TO ix_users_email_lower')
+
+
+def upgrade() -> None:
+    # a constant default doesn't rewrite the table
+    op.add_column(
+        'users',
+        sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'),
+    )
+    _replace_auth_index(AUTH_COLUMNS + ['token_version'])
+
+
+def downgrade() -> None:
+    _replace_auth_index(AUTH_COLUMNS)
+    op.drop_column('users', 'token_version')
@@ -1,10 +1,97 @@
+import hashlib
+import pathlib
+import time
+import uuid
 from datetime import datetime
 from datetime import timedelta
 from typing import Optional
 
+import orjson
+from jose import jwk
 from jose import jwt
+from jose import JWTError
+from jose.backends.base import Key
 
 import settings
+from cache import LRUTTLCache
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "RS384", "RS512", "ES256", "ES384", "ES512")
+
+
+class KeySet:
+    """Parsed signing and verification keys, so no call parses a PEM again.
+
+    ``keys`` maps key ids to keys; HMAC algorithms have a single key under
+    ``None`` and tokens carry no kid.
+    """
+
+    def __init__(self, algorithm: str, keys: dict, active_kid: Optional[str]):
+        self.algorithm = algorithm
+        self.active_kid = active_kid
+        self.signing_key: Key = keys[active_kid]
+        self.headers = None if active_kid is None else {"kid": active_kid}
+        if active_kid is None:
+            self.verification_keys = dict(keys)
+            public_keys = []
+        else:
+            self.verification_keys = {
+                kid: key.public_key() for kid, key in keys.items()
+            }
+            public_keys = [
+                {**key.to_dict(), "kid": kid, "use": "sig"}
+                for kid, key in sorted(self.verification_keys.items())
+            ]
+        # the JWKS document never changes while the process runs
+        self.jwks_body = orjson.dumps({"keys": public_keys})
+        self.jwks_etag = f'"{hashlib.sha256(self.jwks_body).hexdigest()[:32]}"'
+
+    def sign(self, claims: dict) -> str:
+        return jwt.encode(
+            claims, self.signing_key, algorithm=self.algorithm, headers=self.headers
+        )
+
+    def verification_key(self, token: str) -> Key:
+        """Key of the kid in the token header, raises ``JWTError`` if unknown"""
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self.verification_keys.get(kid)
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return key
+
+
+def load_key_set(
+    algorithm: str, secret_key: str, keys_dir: str, active_kid: str
+) -> KeySet:
+    """HMAC algorithms use ``secret_key``. Asymmetric ones load every
+    ``<kid>.pem`` of ``keys_dir``, private or public, and sign with the
+    private key ``active_kid``."""
+    if algorithm.startswith("HS"):
+        return KeySet(algorithm, {None: jwk.construct(secret_key, algorithm)}, None)
+    if algorithm not in ASYMMETRIC_ALGORITHMS:
+        raise ValueError(f"Unsupported ALGORITHM {algorithm!r}")
+    keys = {
+        path.stem: jwk.construct(path.read_text(), algorithm)
+        for path in sorted(pathlib.Path(keys_dir).glob("*.pem"))
+    }
+    if active_kid not in keys:
+        raise ValueError(f"No {active_kid}.pem for JWT_ACTIVE_KID in {keys_dir!r}")
+    if keys[active_kid].is_public():
+        raise ValueError(f"{active_kid}.pem must hold a private key to sign with")
+    return KeySet(algorithm, keys, active_kid)
+
+
+key_set = load_key_set(
+    settings.ALGORITHM,
+    settings.SECRET_KEY,
+    settings.JWT_KEYS_DIR,
+    settings.JWT_ACTIVE_KID,
+)
+
+# claims of already verified tokens, each entry lives until the token expires
+verified_token_cache = LRUTTLCache(
+    "verified_token", maxsize=settings.TOKEN_CACHE_SIZE, ttl=float("inf")
+)
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -14,11 +101,26 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + timedelta(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
-        
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(
-        to_encode, 
-        settings.SECRET_KEY,
-        algotrithm = settings.ALGORITHM, 
-    )
-    return encoded_jwt
\ No newline at end of file
+
+    # the id revocation is keyed on
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
+    encoded_jwt = key_set.sign(to_encode)
+    return encoded_jwt
+
+
+def decode_access_token(token: str) -> dict:
+    """Verify the token and return its claims, raises ``JWTError`` if invalid.
+
+    Claims of valid tokens are cached by a digest of the token, so a client
+    sending the same token again skips the signature check and parsing.
+    """
+    cache_key = hashlib.sha256(token.encode()).digest()
+    claims = verified_token_cache.get(cache_key)
+    if claims is None:
+        claims = jwt.decode(
+            token, key_set.verification_key(token), algorithms=[key_set.algorithm]
+        )
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            verified_token_cache.set(cache_key, claims, ttl=exp - time.time())
+    return dict(claims)
@@ -1,3 +1,5 @@
+import os
+
 from envparse import Env
 
 env = Env()
@@ -13,10 +15,116 @@ TEST_DATABASE_URL = env.str(
 )
 
 SECRET_KEY: str = env.str("SECRET_KEY", default="secret_key")
+# HS256 signs with SECRET_KEY. RS256 or ES256 sign with the private key
+# <JWT_ACTIVE_KID>.pem from JWT_KEYS_DIR; every key there verifies tokens and
+# is published in /.well-known/jwks.json. To rotate, add the new key, wait
+# JWKS_MAX_AGE_SECONDS, switch JWT_ACTIVE_KID, and remove the old key once
+# its last tokens expired.
 ALGORITHM: str = env.str("ALGORITHM", default="HS256")
+JWT_KEYS_DIR: str = env.str("JWT_KEYS_DIR", default="keys")
+JWT_ACTIVE_KID: str = env.str("JWT_ACTIVE_KID", default="")
+JWKS_MAX_AGE_SECONDS: int = env.int("JWKS_MAX_AGE_SECONDS", default=3600)
 ACCESS_TOKEN_EXPIRE_MINUTES: int = env.int("ACCESS_TOKEN_EXPIRE_MINUTES", default=30)
+# tokens carrying user id, roles and token version, so authenticated requests
+# don't touch the database; kept short-lived and renewed with a refresh token
+SELF_CONTAINED_TOKENS: bool = env.bool("SELF_CONTAINED_TOKENS", default=False)
+SELF_CONTAINED_TOKEN_EXPIRE_MINUTES: int = env.int(
+    "SELF_CONTAINED_TOKEN_EXPIRE_MINUTES", default=5
+)
+REFRESH_TOKEN_EXPIRE_MINUTES: int = env.int(
+    "REFRESH_TOKEN_EXPIRE_MINUTES", default=60 * 24 * 7
+)
+# revoked token ids are fetched by every worker this often, fully reloaded
+# (dropping expired ones) every rebuild interval
+REVOCATION_SYNC_INTERVAL_SECONDS: float = env.float(
+    "REVOCATION_SYNC_INTERVAL_SECONDS", default=5.0
+)
+REVOCATION_REBUILD_INTERVAL_SECONDS: float = env.float(
+    "REVOCATION_REBUILD_INTERVAL_SECONDS", default=600.0
+)
+# Bloom filter in front of the revoked ids, grows past capacity on rebuild
+REVOCATION_BLOOM_CAPACITY: int = env.int("REVOCATION_BLOOM_CAPACITY", default=100000)
+REVOCATION_BLOOM_ERROR_RATE: float = env.float(
+    "REVOCATION_BLOOM_ERROR_RATE", default=0.01
+)
 APP_PORT = env.int("APP_PORT", default=8000)
 SENTRY_URL = env.str(
     "SENTRY_URL",
     default="https://3fadd13c42891273c36741b2e003f5e6@o4509518276067328.ingest.de.sentry.io/4509518278688848",
 )
+
+# process pool used for bcrypt, sized to the number of cores by default
+HASHING_POOL_SIZE: int = env.int("HASHING_POOL_SIZE", default=os.cpu_count() or 1)
+# how many hashing jobs may wait for a free worker before new ones get 503
+HASHING_QUEUE_SIZE: int = env.int("HASHING_QUEUE_SIZE", default=64)
+# bcrypt cost of new hashes, weaker hashes are upgraded on the next login
+BCRYPT_ROUNDS: int = env.int("BCRYPT_ROUNDS", default=12)
+# when above 0 the cost is calibrated on startup to the highest rounds whose
+# verify fits this budget, but never below BCRYPT_ROUNDS
+BCRYPT_TARGET_VERIFY_MS: float = env.float("BCRYPT_TARGET_VERIFY_MS", default=0)
+# authenticated users cached per worker, 0 disables the cache
+PRINCIPAL_CACHE_SIZE: int = env.int("PRINCIPAL_CACHE_SIZE", default=10000)
+PRINCIPAL_CACHE_TTL_SECONDS: float = env.float(
+    "PRINCIPAL_CACHE_TTL_SECONDS", default=60.0
+)
+# verified access tokens cached per worker, 0 disables the cache
+TOKEN_CACHE_SIZE: int = env.int("TOKEN_CACHE_SIZE", default=10000)
+# database engine and connection pool
+DB_ECHO: bool = env.bool("DB_ECHO", default=False)
+DB_POOL_SIZE: int = env.int("DB_POOL_SIZE", default=5)
+DB_MAX_OVERFLOW: int = env.int("DB_MAX_OVERFLOW", default=10)
+# seconds after which a connection is replaced, -1 keeps connections forever
+DB_POOL_RECYCLE: int = env.int("DB_POOL_RECYCLE", default=1800)
+DB_POOL_PRE_PING: bool = env.bool("DB_POOL_PRE_PING", default=True)
+# seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT: float = env.float("DB_POOL_TIMEOUT", default=30.0)
+# compiled SQL statements kept per engine
+DB_QUERY_CACHE_SIZE: int = env.int("DB_QUERY_CACHE_SIZE", default=500)
+# prepared statements kept per asyncpg connection, 0 behind pgbouncer in
+# transaction pooling mode
+DB_PREPARED_STATEMENT_CACHE_SIZE: int = env.int(
+    "DB_PREPARED_STATEMENT_CACHE_SIZE", default=100
+)
+# "orm" maps UserDAL reads to User instances, "core" opts in to serving
+# them as plain records without the ORM
+USER_DAL_BACKEND: str = env.str("USER_DAL_BACKEND", default="orm")
+# read replicas for read-only endpoints, comma separated, empty means primary only
+REPLICA_DATABASE_URLS: list = env.list("REPLICA_DATABASE_URLS", default=[])
+REPLICA_HEALTH_CHECK_INTERVAL_SECONDS: float = env.float(
+    "REPLICA_HEALTH_CHECK_INTERVAL_SECONDS", default=5.0
+)
+# replicas replaying WAL further behind than this are taken out of rotation
+REPLICA_MAX_LAG_SECONDS: float = env.float("REPLICA_MAX_LAG_SECONDS", default=5.0)
+# POST /user/batch limits, every password of a batch is hashed before
+# anything is inserted
+USER_BATCH_MAX_SIZE: int = env.int("USER_BATCH_MAX_SIZE", default=100)
+USER_BATCH_INSERT_CHUNK_SIZE: int = env.int(
+    "USER_BATCH_INSERT_CHUNK_SIZE", default=1000
+)
+# page size limits of GET /user/list
+USER_LIST_DEFAULT_LIMIT: int = env.int("USER_LIST_DEFAULT_LIMIT", default=50)
+USER_LIST_MAX_LIMIT: int = env.int("USER_LIST_MAX_LIMIT", default=500)
+# rows fetched per round-trip of the users export cursor
+USER_EXPORT_BATCH_SIZE: int = env.int("USER_EXPORT_BATCH_SIZE", default=1000)
+# token buckets limiting POST /login/token per client address and username,
+# "redis" shares them between workers
+LOGIN_THROTTLE_ENABLED: bool = env.bool("LOGIN_THROTTLE_ENABLED", default=True)
+LOGIN_THROTTLE_BACKEND: str = env.str("LOGIN_THROTTLE_BACKEND", default="memory")
+LOGIN_THROTTLE_REDIS_URL: str = env.str(
+    "LOGIN_THROTTLE_REDIS_URL", default="redis://0.0.0.0:6379/0"
+)
+LOGIN_THROTTLE_MEMORY_MAXSIZE: int = env.int(
+    "LOGIN_THROTTLE_MEMORY_MAXSIZE", default=100000
+)
+# burst size and sustained attempts per minute
+LOGIN_THROTTLE_IP_CAPACITY: float = env.float("LOGIN_THROTTLE_IP_CAPACITY", default=20)
+LOGIN_THROTTLE_IP_PER_MINUTE: float = env.float(
+    "LOGIN_THROTTLE_IP_PER_MINUTE", default=30
+)
+LOGIN_THROTTLE_USERNAME_CAPACITY: float = env.float(
+    "LOGIN_THROTTLE_USERNAME_CAPACITY", default=5
+)
+LOGIN_THROTTLE_USERNAME_PER_MINUTE: float = env.float(
+    "LOGIN_THROTTLE_USERNAME_PER_MINUTE", default=5
+)
+TEST_REDIS_URL: str = env.str("TEST_REDIS_URL", default="redis://0.0.0.0:6380/0")
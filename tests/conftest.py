@@ -9,16 +9,24 @@ import pytest
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from starlette.testclient import TestClient
 
 import settings
+from api import login_handler
+from cache import principal_cache
 from db.models import PortalRole
+from db.models import roles_to_mask
 from db.session import get_db
+from db.session import get_read_db
 from main import app
+from revocation import revocation_list
 from security import create_access_token
+from throttling import create_login_throttle
 
 CLEAN_TABLES = [
     "users",
+    "revoked_tokens",
 ]
 
 
@@ -29,7 +37,7 @@ def event_loop():
     loop.close()
 
 
-@pytest.fixture(scope="session", autouse=True)
+@pytest.fixture(scope="session")
 async def run_migrations():
     os.system("alembic init migrations")
     os.system('alembic revision -- autogenerate -m "test_runnning_migrations"')
@@ -37,13 +45,13 @@ async def run_migrations():
 
 
 @pytest.fixture(scope="session")
-async def async_session_test():
+async def async_session_test(run_migrations):
     engine = create_async_engine(settings.TEST_DATABASE_URL, future=True, echo=True)
     async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
     yield async_session
 
 
-@pytest.fixture(scope="function", autouse=True)
+@pytest.fixture(scope="function")
 async def clear_tables(async_session_test):
     """Clean data in all tables before running test function"""
     async with async_session_test() as session:
@@ -68,19 +76,42 @@ async def _get_test_db():
         pass
 
 
+@pytest.fixture
+def fresh_login_throttle(monkeypatch):
+    """Full login buckets for every test, the module-level throttle would
+    carry attempts over from earlier tests into 429s"""
+    monkeypatch.setattr(login_handler, "login_throttle", create_login_throttle())
+
+
+# the app runs on the TestClient's own event loop, pooled connections
+# would outlive it
+_revocation_sessions = sessionmaker(
+    create_async_engine(settings.TEST_DATABASE_URL, future=True, poolclass=NullPool),
+    expire_on_commit=False,
+    class_=AsyncSession,
+)
+
+
 @pytest.fixture(scope="function")
-async def client() -> Generator[TestClient, Any, None]:
+async def client(
+    clear_tables, fresh_login_throttle, monkeypatch
+) -> Generator[TestClient, Any, None]:
     """
     Create a new FastAPI TestClient that uses the "db_session" fixture to override
-    the 'get_db' dependency that is injected into routes
+    the 'get_db' and 'get_read_db' dependencies that are injected into routes
     """
     app.dependency_overrides[get_db] = _get_test_db
+    app.dependency_overrides[get_read_db] = _get_test_db
+    # tables are truncated between tests behind the cache's back
+    principal_cache.clear()
+    # startup syncs revoked tokens, from the test database too
+    monkeypatch.setattr(revocation_list, "session_factory", _revocation_sessions)
     with TestClient(app) as client:
         yield client
 
 
 @pytest.fixture(scope="session")
-async def asyncpg_pool():
+async def asyncpg_pool(run_migrations):
     pool = await asyncpg.create_pool(
         "".join(settings.TEST_DATABASE_URL.split("+asyncpg"))
     )
@@ -89,18 +120,18 @@ async def asyncpg_pool():
 
 
 @pytest.fixture
-async def get_user_from_database(asyncpg_pool):
+async def get_user_from_database(asyncpg_pool, clear_tables):
     async def get_user_from_database_by_uuid(user_id: str):
         async with asyncpg_pool.acquire() as connection:
             return await connection.fetch(
                 """SELECT * FROM users WHERE user_id = $1;""", user_id
             )
 
-        return get_user_from_database_by_uuid
+    return get_user_from_database_by_uuid
 
 
 @pytest.fixture
-async def create_user_in_database(asyncpg_pool):
+async def create_user_in_database(asyncpg_pool, clear_tables):
     async def create_user_in_database(
         user_id: str,
         name: str,
@@ -119,15 +150,15 @@ async def create_user_in_database(asyncpg_pool):
                 email,
                 is_active,
                 hashed_password,
-                roles,
+                roles_to_mask(roles),
             )
 
-        return create_user_in_database
+    return create_user_in_database
 
 
 def create_test_auth_headers_for_user(email: str) -> dict[str, str]:
     access_token = create_access_token(
         data={"sub": email},
-        expires_db=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
     )
     return {"Authorization": f"Bearer {access_token}"}
@@ -0,0 +1,105 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.orm import Session
+
+import cache
+from cache import LRUTTLCache
+from cache import PrincipalCache
+from db.dals import _invalidate_user_on_commit
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now.value)
+    return now
+
+
+@pytest.fixture
+def principals(monkeypatch):
+    principals = PrincipalCache(maxsize=10, ttl=60)
+    monkeypatch.setattr("db.dals.principal_cache", principals)
+    return principals
+
+
+def make_principal(user_id=None):
+    return SimpleNamespace(user_id=user_id or uuid.uuid4())
+
+
+def test_entries_expire_after_ttl(clock):
+    lru_cache = LRUTTLCache("test", maxsize=10, ttl=60)
+    lru_cache.set("a", 1)
+    lru_cache.set("b", 2, ttl=10)
+    # a per-entry ttl can't outlive the cache wide one
+    lru_cache.set("c", 3, ttl=120)
+    clock.value += 10
+    assert lru_cache.get("a") == 1
+    assert lru_cache.get("b") is None
+    clock.value += 50
+    assert lru_cache.get("a") is None
+    assert lru_cache.get("c") is None
+    assert len(lru_cache) == 0
+    assert lru_cache.stats()["evictions"] == 3
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    lru_cache = LRUTTLCache("test", maxsize=2, ttl=60)
+    lru_cache.set("a", 1)
+    lru_cache.set("b", 2)
+    assert lru_cache.get("a") == 1
+    lru_cache.set("c", 3)
+    assert lru_cache.get("b") is None
+    assert lru_cache.get("a") == 1
+    assert lru_cache.get("c") == 3
+    assert lru_cache.stats() == {
+        "size": 2,
+        "maxsize": 2,
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1,
+    }
+
+
+def test_invalidate_user_drops_their_principal(principals):
+    principal = make_principal()
+    other_principal = make_principal()
+    principals.set("alisherertaev@gmail.com", principal)
+    principals.set("other@gmail.com", other_principal)
+    principals.invalidate_user(principal.user_id)
+    assert principals.get("alisherertaev@gmail.com") is None
+    assert principals.get("other@gmail.com") is other_principal
+    assert principal.user_id not in principals._subjects_by_user_id
+    # unknown users are ignored
+    principals.invalidate_user(uuid.uuid4())
+
+
+def test_replaced_subject_is_not_invalidated_by_its_old_entry(principals):
+    principal = make_principal()
+    principals.set("old@gmail.com", principal)
+    principals.set("new@gmail.com", principal)
+    principals.pop("old@gmail.com")
+    principals.invalidate_user(principal.user_id)
+    assert principals.get("new@gmail.com") is None
+
+
+def test_principal_is_invalidated_only_after_commit(principals):
+    principal = make_principal()
+    principals.set("alisherertaev@gmail.com", principal)
+    session = Session()
+    _invalidate_user_on_commit(session, principal.user_id)
+    assert principals.get("alisherertaev@gmail.com") is principal
+    session.commit()
+    assert principals.get("alisherertaev@gmail.com") is None
+
+
+def test_rolled_back_changes_keep_the_principal(principals):
+    principal = make_principal()
+    principals.set("alisherertaev@gmail.com", principal)
+    session = Session()
+    session.begin()
+    _invalidate_user_on_commit(session, principal.user_id)
+    session.rollback()
+    session.commit()
+    assert principals.get("alisherertaev@gmail.com") is principal
@@ -0,0 +1,24 @@
+import pytest
+
+from api.actions.export import accepts_gzip
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip", True),
+        ("deflate, gzip;q=0.8", True),
+        ("GZIP ; Q=1", True),
+        ("x-gzip", True),
+        ("*", True),
+        ("", False),
+        ("identity", False),
+        ("gzip;q=0", False),
+        ("gzip;q=0.0, deflate", False),
+        ("gzip;q=0, *", False),
+        ("*;q=0", False),
+        ("gzip;q=bogus", False),
+    ],
+)
+def test_accepts_gzip(accept_encoding, expected):
+    assert accepts_gzip(accept_encoding) is expected
@@ -0,0 +1,91 @@
+import json
+from uuid import uuid4
+
+from db.models import PortalRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+async def test_create_users_batch(
+    client, create_user_in_database, get_user_from_database
+):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Linus",
+        "surname": "Torvalds",
+        "email": "linuxmaster@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    await create_user_in_database(**admin_data)
+    batch = {
+        "users": [
+            {
+                "name": "Alisher",
+                "surname": "Yertayev",
+                "email": "alisherertaev@gmail.com",
+                "password": "password",
+            },
+            {
+                "name": "Alexandr",
+                "surname": "Lee",
+                "email": "alisherertaev@gmail.com",
+                "password": "password",
+            },
+            {
+                "name": "Linus",
+                "surname": "Torvalds",
+                "email": "linuxmaster@gmail.com",
+                "password": "password",
+            },
+        ]
+    }
+    resp = client.post(
+        "/user/batch",
+        data=json.dumps(batch),
+        headers=create_test_auth_headers_for_user(admin_data["email"]),
+    )
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert [result["status"] for result in results] == [
+        "created",
+        "duplicate_email",
+        "duplicate_email",
+    ]
+    assert results[1]["user_id"] is None
+    users_from_db = await get_user_from_database(results[0]["user_id"])
+    assert len(users_from_db) == 1
+    user_from_db = dict(users_from_db[0])
+    assert user_from_db["name"] == "Alisher"
+    assert user_from_db["email"] == "alisherertaev@gmail.com"
+    assert user_from_db["is_active"] is True
+
+
+async def test_create_users_batch_by_regular_user(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    batch = {
+        "users": [
+            {
+                "name": "Alexandr",
+                "surname": "Lee",
+                "email": "lee@gmail.com",
+                "password": "password",
+            }
+        ]
+    }
+    resp = client.post(
+        "/user/batch",
+        data=json.dumps(batch),
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 403
+    assert resp.json() == {"detail": "Forbidden."}
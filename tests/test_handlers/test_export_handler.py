@@ -0,0 +1,114 @@
+import json
+from uuid import uuid4
+
+import pytest
+
+from db.models import PortalRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+async def test_export_users_ndjson(client, create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Linus",
+        "surname": "Torvalds",
+        "email": "linuxmaster@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": False,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    for data in [admin_data, user_data]:
+        await create_user_in_database(**data)
+    resp = client.get(
+        "/user/export?format=ndjson",
+        headers=create_test_auth_headers_for_user(admin_data["email"]),
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    exported = {user["email"]: user for user in map(json.loads, resp.text.splitlines())}
+    assert len(exported) == 2
+    assert exported[user_data["email"]]["user_id"] == str(user_data["user_id"])
+    assert exported[user_data["email"]]["is_active"] is False
+    assert exported[user_data["email"]]["roles"] == [PortalRole.ROLE_PORTAL_USER]
+    assert "hashed_password" not in exported[user_data["email"]]
+
+
+async def test_export_users_csv(client, create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Linus",
+        "surname": "Torvalds",
+        "email": "linuxmaster@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_SUPERADMIN],
+    }
+    await create_user_in_database(**admin_data)
+    resp = client.get(
+        "/user/export?format=csv",
+        headers=create_test_auth_headers_for_user(admin_data["email"]),
+    )
+    assert resp.status_code == 200
+    lines = resp.text.splitlines()
+    assert lines[0] == "user_id,name,surname,email,is_active,roles"
+    assert lines[1].startswith(f"{admin_data['user_id']},Linus,Torvalds,")
+
+
+async def test_export_users_forbidden(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.get(
+        "/user/export", headers=create_test_auth_headers_for_user(user_data["email"])
+    )
+    assert resp.status_code == 403
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, content_encoding",
+    [
+        ("gzip, deflate", "gzip"),
+        ("gzip;q=0, deflate", None),
+        ("*;q=0.5", "gzip"),
+        ("identity", None),
+    ],
+)
+async def test_export_users_gzip_negotiation(
+    client, create_user_in_database, accept_encoding, content_encoding
+):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Linus",
+        "surname": "Torvalds",
+        "email": "linuxmaster@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    await create_user_in_database(**admin_data)
+    resp = client.get(
+        "/user/export",
+        headers={
+            **create_test_auth_headers_for_user(admin_data["email"]),
+            "Accept-Encoding": accept_encoding,
+        },
+    )
+    assert resp.status_code == 200
+    assert resp.headers.get("content-encoding") == content_encoding
+    assert json.loads(resp.text.splitlines()[0])["email"] == admin_data["email"]
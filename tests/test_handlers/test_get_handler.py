@@ -1,5 +1,8 @@
 from uuid import uuid4
 
+import pytest
+
+import settings
 from db.models import PortalRole
 from tests.conftest import create_test_auth_headers_for_user
 
@@ -26,6 +29,31 @@ async def test_get_user(client, create_user_in_database):
     assert user_from_response["user_id"] == user_data["user_id"]
 
 
+@pytest.mark.parametrize("backend", ["orm", "core"])
+async def test_get_user_with_each_dal_backend(
+    client, create_user_in_database, monkeypatch, backend
+):
+    monkeypatch.setattr(settings, "USER_DAL_BACKEND", backend)
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.get(
+        f"/user/?user_id={user_data['user_id']}",
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 200
+    user_from_response = resp.json()
+    assert user_from_response["email"] == user_data["email"]
+    assert user_from_response["user_id"] == str(user_data["user_id"])
+
+
 async def test_get_user_id_validation_error(client, create_user_in_database):
     user_data = {
         "user_id": uuid4(),
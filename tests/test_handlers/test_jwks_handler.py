@@ -0,0 +1,60 @@
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+import security
+from api import jwks_handler
+from security import load_key_set
+
+
+def _write_rsa_key(path):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    return key
+
+
+async def test_jwks_of_hmac_key_is_empty(client):
+    resp = client.get("/.well-known/jwks.json")
+    assert resp.status_code == 200
+    assert resp.json() == {"keys": []}
+
+
+async def test_rotated_keys_are_published_and_verify(client, tmp_path, monkeypatch):
+    old_key = _write_rsa_key(tmp_path / "old.pem")
+    _write_rsa_key(tmp_path / "new.pem")
+    old_key_set = load_key_set("RS256", "", str(tmp_path), "old")
+    token = old_key_set.sign({"sub": "alisherertaev@gmail.com"})
+    # the retired key only keeps its public half
+    (tmp_path / "old.pem").write_bytes(
+        old_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+    )
+    key_set = load_key_set("RS256", "", str(tmp_path), "new")
+    monkeypatch.setattr(security, "key_set", key_set)
+    monkeypatch.setattr(jwks_handler, "key_set", key_set)
+
+    assert security.decode_access_token(token)["sub"] == "alisherertaev@gmail.com"
+    new_token = security.create_access_token({"sub": "alisherertaev@gmail.com"})
+    assert jwt.get_unverified_header(new_token)["kid"] == "new"
+
+    resp = client.get("/.well-known/jwks.json")
+    assert resp.status_code == 200
+    assert [key["kid"] for key in resp.json()["keys"]] == ["new", "old"]
+    assert all("d" not in key for key in resp.json()["keys"])
+    assert resp.headers["Cache-Control"].startswith("public, max-age=")
+    # downstream services verify with the published keys alone
+    claims = jwt.decode(new_token, resp.json(), algorithms=["RS256"])
+    assert claims["sub"] == "alisherertaev@gmail.com"
+
+    resp = client.get(
+        "/.well-known/jwks.json", headers={"If-None-Match": resp.headers["ETag"]}
+    )
+    assert resp.status_code == 304
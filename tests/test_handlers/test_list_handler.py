@@ -0,0 +1,132 @@
+from uuid import uuid4
+
+from db.models import PortalRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+async def test_list_users_pagination(client, create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Linus",
+        "surname": "Torvalds",
+        "email": "linuxmaster@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    await create_user_in_database(**admin_data)
+    for index in range(4):
+        await create_user_in_database(
+            user_id=uuid4(),
+            name="Alisher",
+            surname="Yertayev",
+            email=f"alisherertaev{index}@gmail.com",
+            is_active=index % 2 == 0,
+            hashed_password="password",
+            roles=[PortalRole.ROLE_PORTAL_USER],
+        )
+    headers = create_test_auth_headers_for_user(admin_data["email"])
+    seen_user_ids = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor is not None:
+            params["cursor"] = cursor
+        resp = client.get("/user/list", params=params, headers=headers)
+        assert resp.status_code == 200
+        data_from_resp = resp.json()
+        assert len(data_from_resp["users"]) <= 2
+        seen_user_ids.extend(user["user_id"] for user in data_from_resp["users"])
+        cursor = data_from_resp["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen_user_ids) == 5
+    assert seen_user_ids == sorted(seen_user_ids)
+
+    resp = client.get(
+        "/user/list",
+        params={"is_active": False, "role": PortalRole.ROLE_PORTAL_USER.value},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    assert len(resp.json()["users"]) == 2
+
+
+async def test_list_users_forbidden(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.get(
+        "/user/list", headers=create_test_auth_headers_for_user(user_data["email"])
+    )
+    assert resp.status_code == 403
+    assert resp.json() == {"detail": "Forbidden."}
+
+
+async def test_list_users_invalid_cursor(client, create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Linus",
+        "surname": "Torvalds",
+        "email": "linuxmaster@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_SUPERADMIN],
+    }
+    await create_user_in_database(**admin_data)
+    resp = client.get(
+        "/user/list?cursor=abc",
+        headers=create_test_auth_headers_for_user(admin_data["email"]),
+    )
+    assert resp.status_code == 422
+    assert resp.json() == {"detail": "Invalid cursor"}
+
+
+async def test_list_users_by_role(client, create_user_in_database):
+    superadmin_data = {
+        "user_id": uuid4(),
+        "name": "Linus",
+        "surname": "Torvalds",
+        "email": "linuxmaster@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_SUPERADMIN],
+    }
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alexandr",
+        "surname": "Lee",
+        "email": "lee@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    for data in [superadmin_data, admin_data, user_data]:
+        await create_user_in_database(**data)
+    resp = client.get(
+        "/user/by_role",
+        params={"role": PortalRole.ROLE_PORTAL_ADMIN.value},
+        headers=create_test_auth_headers_for_user(superadmin_data["email"]),
+    )
+    assert resp.status_code == 200
+    data_from_resp = resp.json()
+    assert [user["user_id"] for user in data_from_resp["users"]] == [
+        str(admin_data["user_id"])
+    ]
+    assert data_from_resp["next_cursor"] is None
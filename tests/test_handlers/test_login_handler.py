@@ -0,0 +1,273 @@
+from uuid import uuid4
+
+import settings
+from api.actions import auth
+from db.models import PortalRole
+from hashing import AsyncHasher
+from hashing import make_pwd_context
+from security import create_access_token
+from tests.conftest import create_test_auth_headers_for_user
+
+
+async def test_login_rehashes_weak_password_hash(
+    client, create_user_in_database, get_user_from_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": True,
+        "hashed_password": make_pwd_context(4).hash("SamplePass1!"),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 200
+    assert resp.json()["token_type"] == "bearer"
+    users_from_db = await get_user_from_database(user_data["user_id"])
+    hashed_password = dict(users_from_db[0])["hashed_password"]
+    assert hashed_password != user_data["hashed_password"]
+    assert hashed_password.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 200
+
+
+async def test_login_keeps_hash_of_configured_cost(
+    client, create_user_in_database, get_user_from_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": True,
+        "hashed_password": make_pwd_context(settings.BCRYPT_ROUNDS).hash(
+            "SamplePass1!"
+        ),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 200
+    users_from_db = await get_user_from_database(user_data["user_id"])
+    assert dict(users_from_db[0])["hashed_password"] == user_data["hashed_password"]
+
+
+async def test_login_rejects_inactive_user(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "inactive_user@gmail.com",
+        "is_active": False,
+        "hashed_password": make_pwd_context(settings.BCRYPT_ROUNDS).hash(
+            "SamplePass1!"
+        ),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "Incorrect username or password"}
+
+
+async def test_self_contained_token_of_inactive_user_is_rejected(client):
+    access_token = create_access_token(
+        {
+            "typ": "access",
+            "sub": "alisherertaev@gmail.com",
+            "uid": str(uuid4()),
+            "roles": PortalRole.ROLE_PORTAL_USER.bit,
+            "act": False,
+            "ver": 0,
+        }
+    )
+    resp = client.get(
+        "/login/test_auth_endpoint",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "Could not validate credentials"}
+
+
+async def test_legacy_token_of_deleted_user_is_rejected(
+    client, create_user_in_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "deleted_user@gmail.com",
+        "is_active": True,
+        "hashed_password": "password",
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+    resp = client.get("/login/test_auth_endpoint", headers=headers)
+    assert resp.status_code == 200
+    resp = client.delete(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+    resp = client.get("/login/test_auth_endpoint", headers=headers)
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "Could not validate credentials"}
+
+
+async def test_self_contained_tokens_and_refresh(
+    client, create_user_in_database, monkeypatch
+):
+    monkeypatch.setattr(settings, "SELF_CONTAINED_TOKENS", True)
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": True,
+        "hashed_password": make_pwd_context(settings.BCRYPT_ROUNDS).hash(
+            "SamplePass1!"
+        ),
+        "roles": [PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_ADMIN],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 200
+    tokens = resp.json()
+    assert tokens["refresh_token"]
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    resp = client.get("/login/test_auth_endpoint", headers=headers)
+    assert resp.status_code == 200
+    current_user = resp.json()["current_user"]
+    assert current_user["user_id"] == str(user_data["user_id"])
+    assert current_user["is_admin"] is True
+    # a refresh token is not accepted as an access token
+    resp = client.get(
+        "/login/test_auth_endpoint",
+        headers={"Authorization": f"Bearer {tokens['refresh_token']}"},
+    )
+    assert resp.status_code == 401
+
+    resp = client.post(
+        "/login/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert resp.status_code == 200
+    refreshed = resp.json()
+    assert refreshed["access_token"] and refreshed["refresh_token"]
+
+    # changing a claim bumps the token version, older refresh tokens stop working
+    resp = client.patch(
+        f"/user/?user_id={user_data['user_id']}",
+        json={"email": "new_email@gmail.com"},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    resp = client.post(
+        "/login/refresh", json={"refresh_token": refreshed["refresh_token"]}
+    )
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "Invalid refresh token"}
+
+
+async def test_logout_revokes_access_and_refresh_token(
+    client, create_user_in_database, monkeypatch
+):
+    monkeypatch.setattr(settings, "SELF_CONTAINED_TOKENS", True)
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": True,
+        "hashed_password": make_pwd_context(settings.BCRYPT_ROUNDS).hash(
+            "SamplePass1!"
+        ),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    tokens = resp.json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/login/test_auth_endpoint", headers=headers).status_code == 200
+    resp = client.post(
+        "/login/logout",
+        json={"refresh_token": tokens["refresh_token"]},
+        headers=headers,
+    )
+    assert resp.status_code == 204
+    resp = client.get("/login/test_auth_endpoint", headers=headers)
+    assert resp.status_code == 401
+    resp = client.post(
+        "/login/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert resp.status_code == 401
+    resp = client.post("/login/logout", headers={"Authorization": "Bearer not-a-token"})
+    assert resp.status_code == 401
+
+
+async def test_refresh_token_is_single_use(
+    client, create_user_in_database, monkeypatch
+):
+    monkeypatch.setattr(settings, "SELF_CONTAINED_TOKENS", True)
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": True,
+        "hashed_password": make_pwd_context(settings.BCRYPT_ROUNDS).hash(
+            "SamplePass1!"
+        ),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    refresh_token = resp.json()["refresh_token"]
+    resp = client.post("/login/refresh", json={"refresh_token": refresh_token})
+    assert resp.status_code == 200
+    resp = client.post("/login/refresh", json={"refresh_token": refresh_token})
+    assert resp.status_code == 401
+
+
+async def test_login_returns_503_when_hashing_queue_is_full(
+    client, create_user_in_database, monkeypatch
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "busy_hasher@gmail.com",
+        "is_active": True,
+        "hashed_password": make_pwd_context(4).hash("SamplePass1!"),
+        "roles": [PortalRole.ROLE_PORTAL_USER],
+    }
+    await create_user_in_database(**user_data)
+    hasher = AsyncHasher(max_workers=1, max_queue_size=0, rounds=4)
+    hasher._pending = hasher.max_pending
+    monkeypatch.setattr(auth, "async_hasher", hasher)
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "SamplePass1!"},
+    )
+    assert resp.status_code == 503
+    assert resp.json() == {"detail": "Password hashing queue is full"}
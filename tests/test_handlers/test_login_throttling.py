@@ -0,0 +1,118 @@
+import pytest
+
+import settings
+from api import login_handler
+from throttling import LoginThrottle
+from throttling import MemoryBucketStore
+from throttling import RedisBucketStore
+
+
+def _throttle(ip_capacity=100, username_capacity=100):
+    return LoginThrottle(
+        MemoryBucketStore(maxsize=100),
+        ip_capacity=ip_capacity,
+        ip_refill_rate=0.001,
+        username_capacity=username_capacity,
+        username_refill_rate=0.001,
+    )
+
+
+async def test_login_throttled_per_username(client, monkeypatch):
+    monkeypatch.setattr(login_handler, "login_throttle", _throttle(username_capacity=2))
+    form = {"username": "alisherertaev@gmail.com", "password": "wrong"}
+    for _ in range(2):
+        resp = client.post("/login/token", data=form)
+        assert resp.status_code == 401
+    resp = client.post("/login/token", data=form)
+    assert resp.status_code == 429
+    assert resp.json() == {"detail": "Too many login attempts"}
+    assert int(resp.headers["Retry-After"]) > 0
+    # the username bucket is keyed case-insensitively
+    form["username"] = form["username"].upper()
+    resp = client.post("/login/token", data=form)
+    assert resp.status_code == 429
+
+
+async def test_login_throttled_per_ip(client, monkeypatch):
+    monkeypatch.setattr(login_handler, "login_throttle", _throttle(ip_capacity=2))
+    for number in range(2):
+        resp = client.post(
+            "/login/token",
+            data={"username": f"user{number}@example.com", "password": "wrong"},
+        )
+        assert resp.status_code == 401
+    resp = client.post(
+        "/login/token", data={"username": "another@example.com", "password": "wrong"}
+    )
+    assert resp.status_code == 429
+
+
+async def test_ip_rejection_leaves_username_bucket_alone():
+    throttle = _throttle(ip_capacity=1, username_capacity=1)
+    assert await throttle.check("10.0.0.1", "alisherertaev@gmail.com") == 0
+    # the attacker's address is out of tokens, the victim's bucket is not touched
+    for _ in range(3):
+        assert await throttle.check("10.0.0.1", "victim@gmail.com") > 0
+    assert await throttle.check("10.0.0.2", "victim@gmail.com") == 0
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Point RedisBucketStore at an in-process server that runs the Lua
+    script for real, so no Redis is needed"""
+    fakeredis = pytest.importorskip("fakeredis")
+    fake_aioredis = pytest.importorskip("fakeredis.aioredis")
+    pytest.importorskip("lupa")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        "redis.asyncio.from_url",
+        lambda url: fake_aioredis.FakeRedis(server=server),
+    )
+    return server
+
+
+async def test_redis_bucket_store_script(fake_redis):
+    store = RedisBucketStore(settings.TEST_REDIS_URL, key_prefix="test-throttle:")
+    try:
+        assert await store.take("bucket", capacity=2, refill_rate=0.001) == 0
+        assert await store.take("bucket", capacity=2, refill_rate=0.001) == 0
+        wait = await store.take("bucket", capacity=2, refill_rate=0.001)
+        assert 0 < wait <= 1000
+        # buckets are separate per key and expire once they would be full again
+        assert await store.take("other", capacity=2, refill_rate=0.001) == 0
+        assert 0 < await store._client.pttl("test-throttle:bucket") <= 2_001_000
+    finally:
+        await store.close()
+
+
+async def test_login_throttled_with_redis_store(client, monkeypatch, fake_redis):
+    throttle = LoginThrottle(
+        RedisBucketStore(settings.TEST_REDIS_URL),
+        ip_capacity=100,
+        ip_refill_rate=0.001,
+        username_capacity=1,
+        username_refill_rate=0.001,
+    )
+    monkeypatch.setattr(login_handler, "login_throttle", throttle)
+    form = {"username": "alisherertaev@gmail.com", "password": "wrong"}
+    assert client.post("/login/token", data=form).status_code == 401
+    resp = client.post("/login/token", data=form)
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) > 0
+
+
+async def test_redis_bucket_store():
+    redis = pytest.importorskip("redis")
+    store = RedisBucketStore(settings.TEST_REDIS_URL, key_prefix="test-throttle:")
+    try:
+        await store._client.delete("test-throttle:bucket")
+    except redis.exceptions.ConnectionError:
+        await store.close()
+        pytest.skip(f"no Redis-protocol server at {settings.TEST_REDIS_URL}")
+    try:
+        assert await store.take("bucket", capacity=2, refill_rate=0.001) == 0
+        assert await store.take("bucket", capacity=2, refill_rate=0.001) == 0
+        assert await store.take("bucket", capacity=2, refill_rate=0.001) > 0
+    finally:
+        await store._client.delete("test-throttle:bucket")
+        await store.close()
@@ -2,6 +2,7 @@ from uuid import uuid4
 
 import pytest
 
+from db.models import mask_to_roles
 from db.models import PortalRole
 from tests.conftest import create_test_auth_headers_for_user
 
@@ -41,7 +42,9 @@ async def test_add_admin_role_to_user_by_superadmin(
     assert len(updated_user_from_db) == 1
     updated_user_from_db = dict(updated_user_from_db[0])
     assert updated_user_from_db["user_id"] == user_data_for_promotion["user_id"]
-    assert PortalRole.ROLE_PORTAL_ADMIN in updated_user_from_db["roles"]
+    assert PortalRole.ROLE_PORTAL_ADMIN in mask_to_roles(
+        updated_user_from_db["role_mask"]
+    )
 
 
 async def test_revoke_admin_role_from_user_by_superadmin(
@@ -79,7 +82,9 @@ async def test_revoke_admin_role_from_user_by_superadmin(
     assert len(revoked_user_from_db) == 1
     revoked_user_from_db = dict(revoked_user_from_db[0])
     assert revoked_user_from_db["user_id"] == user_data_for_revoke["user_id"]
-    assert PortalRole.ROLE_PORTAL_ADMIN not in revoked_user_from_db["roles"]
+    assert PortalRole.ROLE_PORTAL_ADMIN not in mask_to_roles(
+        revoked_user_from_db["role_mask"]
+    )
 
 
 @pytest.mark.parametrize(
@@ -127,4 +132,6 @@ async def test_revoke_admin_role_from_user_by_wrong_type_of_user(
     assert len(not_revoked_user_from_db) == 1
     not_revoked_user_from_db = dict(not_revoked_user_from_db[0])
     assert not_revoked_user_from_db["user_id"] == user_data_for_revoke["user_id"]
-    assert PortalRole.ROLE_PORTAL_ADMIN in not_revoked_user_from_db["roles"]
+    assert PortalRole.ROLE_PORTAL_ADMIN in mask_to_roles(
+        not_revoked_user_from_db["role_mask"]
+    )
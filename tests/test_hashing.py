@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from hashing import AsyncHasher
+from hashing import HashingQueueFull
+
+
+@pytest.fixture
+def async_hasher():
+    hasher = AsyncHasher(max_workers=1, max_queue_size=1, rounds=4)
+    yield hasher
+    hasher.shutdown()
+
+
+async def test_hash_and_verify_round_trip(async_hasher):
+    hashed_password = await async_hasher.get_password_hash("SamplePass1!")
+    assert hashed_password.startswith("$2b$04$")
+    assert await async_hasher.verify_password("SamplePass1!", hashed_password)
+    assert not await async_hasher.verify_password("WrongPass1!", hashed_password)
+    assert async_hasher._pending == 0
+
+
+async def test_jobs_beyond_the_queue_are_rejected(async_hasher):
+    # one job for the worker and one waiting fill the queue
+    jobs = [
+        asyncio.ensure_future(async_hasher.get_password_hash("SamplePass1!"))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+    with pytest.raises(HashingQueueFull):
+        await async_hasher.get_password_hash("SamplePass1!")
+    await asyncio.gather(*jobs)
+    # the slots are given back once the jobs are done
+    assert async_hasher._pending == 0
+    assert await async_hasher.get_password_hash("SamplePass1!")
+
+
+async def test_batch_larger_than_the_queue_is_hashed(async_hasher):
+    hashed_passwords = await async_hasher.get_password_hashes(
+        [f"SamplePass{i}!" for i in range(5)]
+    )
+    assert len(hashed_passwords) == 5
+    assert await async_hasher.verify_password("SamplePass3!", hashed_passwords[3])
+    assert async_hasher._pending == 0
+
+
+async def test_batch_is_rejected_when_the_queue_is_full(async_hasher):
+    jobs = [
+        asyncio.ensure_future(async_hasher.get_password_hash("SamplePass1!"))
+        for _ in range(2)
+    ]
+    await asyncio.sleep(0)
+    with pytest.raises(HashingQueueFull):
+        await async_hasher.get_password_hashes(["SamplePass1!", "SamplePass2!"])
+    await asyncio.gather(*jobs)
+    assert async_hasher._pending == 0
+
+
+async def test_cancelled_job_keeps_its_slot_until_the_worker_is_done():
+    hasher = AsyncHasher(max_workers=1, max_queue_size=0, rounds=12)
+    try:
+        # the worker process is up before the job that gets cancelled
+        await hasher.get_password_hash("SamplePass1!")
+        job = asyncio.ensure_future(hasher.get_password_hash("SamplePass1!"))
+        await asyncio.sleep(0.05)
+        job.cancel()
+        await asyncio.gather(job, return_exceptions=True)
+        # the worker is still hashing, nothing else may be admitted
+        with pytest.raises(HashingQueueFull):
+            await hasher.get_password_hash("SamplePass1!")
+        for _ in range(100):
+            if hasher._pending == 0:
+                break
+            await asyncio.sleep(0.05)
+        assert hasher._pending == 0
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,34 @@
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import text
+
+from db.instrumentation import _count_rows
+from db.records import AuthRecord
+
+
+def make_auth_record() -> AuthRecord:
+    return AuthRecord(uuid.uuid4(), "alisherertaev@gmail.com", "hashed", 1, True, 0)
+
+
+def fetch_row():
+    with create_engine("sqlite://").connect() as connection:
+        return connection.execute(text("SELECT 1 AS a, 2 AS b, 3 AS c")).fetchone()
+
+
+@pytest.mark.parametrize(
+    "result, rows",
+    [
+        (None, 0),
+        (make_auth_record(), 1),
+        (fetch_row(), 1),
+        (uuid.uuid4(), 1),
+        ([make_auth_record(), make_auth_record()], 2),
+        ({"a@gmail.com": uuid.uuid4()}, 1),
+        (set(), 0),
+    ],
+    ids=["none", "record", "row", "scalar", "list", "dict", "empty_set"],
+)
+def test_count_rows(result, rows):
+    assert _count_rows(result) == rows
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import db.session
+from db.session import get_read_db
+from db.session import ReplicaSet
+
+
+def make_engine(name: str):
+    # nothing connects, the replication lag is faked
+    return create_async_engine(f"postgresql+asyncpg://{name}/portal")
+
+
+@pytest.fixture
+def replica_set():
+    return ReplicaSet(
+        [make_engine("replica0"), make_engine("replica1"), make_engine("replica2")],
+        check_interval=0.1,
+        max_lag=5,
+    )
+
+
+def fake_lags(replica_set, monkeypatch, lags: dict):
+    async def replication_lag(engine):
+        lag = lags[engine.url.host]
+        if isinstance(lag, Exception):
+            raise lag
+        if lag is None:
+            # never answers
+            await asyncio.sleep(3600)
+        return lag
+
+    monkeypatch.setattr(replica_set, "_replication_lag", replication_lag)
+
+
+def test_pick_rotates_over_replicas(replica_set):
+    picked = [replica_set.pick().url.host for _ in range(6)]
+    assert picked == ["replica0", "replica1", "replica2"] * 2
+
+
+async def test_check_drops_lagging_and_unreachable_replicas(replica_set, monkeypatch):
+    fake_lags(
+        replica_set,
+        monkeypatch,
+        {"replica0": 0, "replica1": 30, "replica2": OSError("connection refused")},
+    )
+    await replica_set.check()
+    assert [replica_set.pick().url.host for _ in range(2)] == ["replica0", "replica0"]
+
+
+async def test_check_times_out_on_a_hanging_replica(replica_set, monkeypatch):
+    fake_lags(
+        replica_set, monkeypatch, {"replica0": None, "replica1": 0, "replica2": 1}
+    )
+    await asyncio.wait_for(replica_set.check(), 1)
+    assert {replica_set.pick().url.host for _ in range(4)} == {"replica1", "replica2"}
+
+
+async def test_replicas_come_back_once_healthy(replica_set, monkeypatch):
+    lags = {"replica0": 30, "replica1": 30, "replica2": 30}
+    fake_lags(replica_set, monkeypatch, lags)
+    await replica_set.check()
+    assert replica_set.pick() is None
+    lags["replica1"] = 0
+    await replica_set.check()
+    assert replica_set.pick().url.host == "replica1"
+
+
+async def test_read_db_falls_back_to_the_primary(replica_set, monkeypatch):
+    fake_lags(
+        replica_set, monkeypatch, {"replica0": 30, "replica1": 30, "replica2": 30}
+    )
+    await replica_set.check()
+    monkeypatch.setattr(db.session, "replicas", replica_set)
+    sessions = get_read_db()
+    session = await sessions.__anext__()
+    assert session.bind is db.session.engine
+    await sessions.aclose()
+
+
+async def test_read_db_uses_a_healthy_replica(replica_set, monkeypatch):
+    monkeypatch.setattr(db.session, "replicas", replica_set)
+    sessions = get_read_db()
+    session = await sessions.__anext__()
+    assert session.bind is replica_set.engines[0]
+    await sessions.aclose()
@@ -0,0 +1,25 @@
+import uuid
+
+import orjson
+from asyncpg.pgproto.pgproto import UUID as AsyncpgUUID
+
+from api.responses import SchemaResponse
+from api.schemas import ShowUser
+
+
+def test_schema_response_encodes_asyncpg_uuids():
+    user_id = uuid.uuid4()
+    user = ShowUser(
+        user_id=AsyncpgUUID(str(user_id)),
+        name="Alisher",
+        surname="Yertayev",
+        email="alisherertaev@gmail.com",
+        is_active=True,
+    )
+    assert orjson.loads(SchemaResponse(user).body) == {
+        "user_id": str(user_id),
+        "name": "Alisher",
+        "surname": "Yertayev",
+        "email": "alisherertaev@gmail.com",
+        "is_active": True,
+    }
@@ -0,0 +1,72 @@
+from datetime import datetime
+from datetime import timezone
+from types import SimpleNamespace
+from uuid import uuid4
+
+from revocation import RevocationList
+
+
+class FakeSession:
+    """Stands in for the sessions of ``session_factory``, every statement
+    returns ``rows``"""
+
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.statements = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def begin(self):
+        return self
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return SimpleNamespace(rowcount=0, fetchall=lambda: self.rows)
+
+
+def test_revocation_list_rebuild():
+    revocation_list = RevocationList(
+        sync_interval=5, rebuild_interval=600, capacity=10, error_rate=0.01
+    )
+    synced = [uuid4().hex for _ in range(50)]
+    revocation_list.rebuild(synced)
+    assert all(revocation_list.is_revoked(jti) for jti in synced)
+    assert not revocation_list.is_revoked(uuid4().hex)
+    # revoked locally while a sync was under way
+    local = uuid4().hex
+    revocation_list.add(local)
+    assert revocation_list.is_revoked(local)
+    # the expired ones are gone from the next sync, the local one is kept
+    revocation_list.rebuild(synced[:10])
+    assert len(revocation_list) == 11
+    assert revocation_list.is_revoked(local)
+    assert not any(revocation_list.is_revoked(jti) for jti in synced[10:])
+
+
+async def test_revocation_list_syncs_through_its_session_factory():
+    rows = [
+        SimpleNamespace(
+            jti=uuid4(), revoked_at=datetime(2026, 10, 18, tzinfo=timezone.utc)
+        )
+    ]
+    session = FakeSession(rows)
+    revocation_list = RevocationList(
+        sync_interval=5,
+        rebuild_interval=600,
+        capacity=10,
+        error_rate=0.01,
+        session_factory=lambda: session,
+    )
+    await revocation_list.sync()
+    assert revocation_list.is_revoked(rows[0].jti.hex)
+    # the first sync is a full one, it drops expired tokens first
+    assert [statement.is_delete for statement in session.statements] == [True, False]
+    session.statements.clear()
+    rows.append(SimpleNamespace(jti=uuid4(), revoked_at=datetime.now(timezone.utc)))
+    await revocation_list.sync()
+    assert revocation_list.is_revoked(rows[1].jti.hex)
+    assert [statement.is_delete for statement in session.statements] == [False]
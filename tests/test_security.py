@@ -0,0 +1,68 @@
+import hashlib
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from jose import JWTError
+
+import cache
+from security import create_access_token
+from security import decode_access_token
+from security import verified_token_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_token_cache():
+    verified_token_cache.clear()
+    yield
+    verified_token_cache.clear()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now.value)
+    return now
+
+
+def test_verified_claims_are_cached():
+    token = create_access_token({"sub": "alisherertaev@gmail.com"})
+    assert decode_access_token(token)["sub"] == "alisherertaev@gmail.com"
+    assert len(verified_token_cache) == 1
+    hits = verified_token_cache.hits
+    claims = decode_access_token(token)
+    assert verified_token_cache.hits == hits + 1
+    assert claims["sub"] == "alisherertaev@gmail.com"
+    # callers get a copy, changing it leaves the cached claims alone
+    claims["sub"] = "changed"
+    assert decode_access_token(token)["sub"] == "alisherertaev@gmail.com"
+
+
+def test_cached_claims_expire_with_the_token(clock):
+    token = create_access_token(
+        {"sub": "alisherertaev@gmail.com"}, expires_delta=timedelta(seconds=2)
+    )
+    decode_access_token(token)
+    cache_key = hashlib.sha256(token.encode()).digest()
+    assert verified_token_cache.get(cache_key) is not None
+    # jose truncates exp to whole seconds, the entry never outlives it
+    clock.value += 2.1
+    assert verified_token_cache.get(cache_key) is None
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        create_access_token({"sub": "alisherertaev@gmail.com"}) + "a",
+        create_access_token(
+            {"sub": "alisherertaev@gmail.com"}, expires_delta=timedelta(seconds=-1)
+        ),
+        "not-a-token",
+    ],
+    ids=["bad_signature", "expired", "malformed"],
+)
+def test_invalid_tokens_are_never_cached(token):
+    for _ in range(2):
+        with pytest.raises(JWTError):
+            decode_access_token(token)
+    assert len(verified_token_cache) == 0
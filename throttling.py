@@ -0,0 +1,172 @@
+"""Token bucket rate limiting of login attempts.
+
+A bucket holds up to ``capacity`` tokens and regains ``refill_rate`` tokens
+per second, every attempt takes one. Buckets live in a pluggable store:
+``MemoryBucketStore`` is per worker process, ``RedisBucketStore`` is shared
+by every worker talking to the same Redis-protocol server.
+"""
+import time
+from abc import ABC
+from abc import abstractmethod
+from collections import OrderedDict
+from logging import getLogger
+from typing import Optional
+
+import settings
+from metrics import LOGIN_THROTTLE_DECISIONS
+
+logger = getLogger(__name__)
+
+
+class BucketStore(ABC):
+    @abstractmethod
+    async def take(self, key: str, capacity: float, refill_rate: float) -> float:
+        """Take a token from the bucket of ``key``.
+
+        Returns 0 if one was taken, otherwise the seconds until the bucket
+        holds a token again.
+        """
+
+    async def close(self):
+        pass
+
+
+class MemoryBucketStore(BucketStore):
+    """Buckets of a single process, least recently used ones are dropped
+    beyond ``maxsize``. Meant to be used from the event loop only."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, capacity: float, refill_rate: float) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / refill_rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.maxsize:
+            # a dropped bucket comes back full, so keep the limit generous
+            self._buckets.popitem(last=False)
+        return wait
+
+
+# Runs atomically on the server and uses the server clock, so any number of
+# app processes share one bucket per key. Numbers are returned as strings,
+# Redis would truncate them to integers.
+TAKE_TOKEN_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * refill_rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / refill_rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / refill_rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisBucketStore(BucketStore):
+    """Buckets kept in Redis, or anything speaking its protocol and
+    running Lua scripts. Needs the ``redis`` package."""
+
+    def __init__(self, url: str, key_prefix: str = "throttle:"):
+        try:
+            import redis.asyncio
+        except ImportError as err:
+            raise ImportError(
+                "RedisBucketStore needs the redis package, pip install redis"
+            ) from err
+        self.key_prefix = key_prefix
+        self._client = redis.asyncio.from_url(url)
+        self._take_token = self._client.register_script(TAKE_TOKEN_SCRIPT)
+
+    async def take(self, key: str, capacity: float, refill_rate: float) -> float:
+        wait = await self._take_token(
+            keys=[self.key_prefix + key], args=[capacity, refill_rate]
+        )
+        return float(wait)
+
+    async def close(self):
+        await self._client.close()
+
+
+class LoginThrottle:
+    """Limits login attempts per client address and per username.
+
+    An attempt is let through only if both buckets had a token. The client
+    address is checked first and an attempt it rejects leaves the username
+    bucket alone, so flooding from one address can't lock a victim out.
+    """
+
+    def __init__(
+        self,
+        store: BucketStore,
+        ip_capacity: float,
+        ip_refill_rate: float,
+        username_capacity: float,
+        username_refill_rate: float,
+    ):
+        self.store = store
+        self.limits = {
+            "ip": (ip_capacity, ip_refill_rate),
+            "username": (username_capacity, username_refill_rate),
+        }
+
+    async def _take(self, bucket: str, key: str) -> float:
+        capacity, refill_rate = self.limits[bucket]
+        try:
+            wait = await self.store.take(f"{bucket}:{key}", capacity, refill_rate)
+        except Exception as err:
+            # an unavailable store must not lock everybody out
+            logger.warning("login throttle store failed, letting through: %s", err)
+            LOGIN_THROTTLE_DECISIONS.labels(bucket, "error").inc()
+            return 0.0
+        LOGIN_THROTTLE_DECISIONS.labels(bucket, "rejected" if wait else "allowed").inc()
+        return wait
+
+    async def check(self, client_ip: Optional[str], username: str) -> float:
+        """Return 0 if the attempt may proceed, otherwise the seconds to
+        wait before trying again"""
+        if client_ip is not None:
+            wait = await self._take("ip", client_ip)
+            if wait:
+                return wait
+        return await self._take("username", username.lower())
+
+
+def create_login_throttle() -> Optional[LoginThrottle]:
+    if not settings.LOGIN_THROTTLE_ENABLED:
+        return None
+    if settings.LOGIN_THROTTLE_BACKEND == "redis":
+        store = RedisBucketStore(settings.LOGIN_THROTTLE_REDIS_URL)
+    elif settings.LOGIN_THROTTLE_BACKEND == "memory":
+        store = MemoryBucketStore(settings.LOGIN_THROTTLE_MEMORY_MAXSIZE)
+    else:
+        raise ValueError(
+            "LOGIN_THROTTLE_BACKEND must be 'memory' or 'redis', "
+            f"got {settings.LOGIN_THROTTLE_BACKEND!r}"
+        )
+    return LoginThrottle(
+        store,
+        ip_capacity=settings.LOGIN_THROTTLE_IP_CAPACITY,
+        ip_refill_rate=settings.LOGIN_THROTTLE_IP_PER_MINUTE / 60,
+        username_capacity=settings.LOGIN_THROTTLE_USERNAME_CAPACITY,
+        username_refill_rate=settings.LOGIN_THROTTLE_USERNAME_PER_MINUTE / 60,
+    )
+
+
+login_throttle = create_login_throttle()